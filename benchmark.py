@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import resource
+import platform
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from synthetic_data import generate
+
+# times and memory-profiles the pipeline on synthetic data at several scales
+# every case runs in a fresh process inside a scratch copy of the data layout, so timings
+# are cold and the peak rss is that case's own - inputs are loaded before the clock starts
+# and count towards setup_rss_mb, peak_rss_mb is the high water mark of the whole process
+# dashboard:cold and dashboard:first_chart track the dashboard's cold start, service:* the
+# query service's throughput and latency under concurrent clients
+# results are appended as json lines tagged with the commit, --compare lines two commits up
+# python benchmark.py [--scales 1 10 100] [--repeat N] [--work-dir DIR] [--output FILE]
+# python benchmark.py --compare <old commit> <new commit> [--output FILE]
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = f"{repo_dir}/benchmark_results.jsonl"
+RUN_KEYS = ['seconds', 'peak_rss_mb', 'setup_rss_mb']
+
+clean_tables = ['conflicts', 'resolutions', 'members']
+features = [
+    'conflict_features', 'member_features', 'resolution_features',
+    'resolution_parts', 'un_sessions', 'resolution_cube', 'conflict_cube',
+    'resolution_mentions', 'conflict_countries', 'resolution_swings',
+]
+
+
+# cases - each returns the function to time and its arguments, a function measuring for itself
+# returns a Measured dict that goes into the record, its 'seconds' replacing the wall time
+
+class Measured(dict):
+    pass
+
+
+def clean_case(name):
+    import data_cleaner
+    return data_cleaner.rebuild, (name,)
+
+
+def write_features_case(_):
+    import create_features
+    return create_features.full_build, ()
+
+
+def feature_case(name):
+    import feature_engine
+    from storage import CLEAN_DIR, FEATURE_DIR, read_table
+
+    inputs = {
+        'conflict_features': lambda: (read_table(CLEAN_DIR, 'conflicts'),),
+        'member_features': lambda: (read_table(CLEAN_DIR, 'members'),),
+        'resolution_features': lambda: (read_table(CLEAN_DIR, 'resolutions'), read_table(CLEAN_DIR, 'members')),
+        'resolution_parts': lambda: (read_table(FEATURE_DIR, 'resolutions'),),
+        'un_sessions': lambda: (read_table(FEATURE_DIR, 'resolutions'),),
+        'resolution_cube': lambda: (read_table(FEATURE_DIR, 'resolutions'),),
+        'conflict_cube': lambda: (read_table(FEATURE_DIR, 'conflicts'),),
+        'resolution_mentions': lambda: (
+            read_table(FEATURE_DIR, 'resolutions'), read_table(CLEAN_DIR, 'members'), read_table(CLEAN_DIR, 'conflicts'),
+        ),
+        'conflict_countries': lambda: (read_table(CLEAN_DIR, 'conflicts'), read_table(CLEAN_DIR, 'members')),
+        'resolution_swings': lambda: (read_table(FEATURE_DIR, 'resolutions'),),
+    }
+    return getattr(feature_engine, name), inputs[name]()
+
+
+def statistics_case(_):
+    import create_features
+    return create_features.build_statistics, ()
+
+
+def rules_sweep_case(n_thresholds):
+    # what-if voting rules - pass rates per session of n_thresholds x n_thresholds thresholds
+    # (other x important) for every abstention handling, the simulator built before the clock
+    import numpy as np
+    from storage import FEATURE_DIR, read_table
+    from voting_rules import ABSTENTIONS, VoteSimulator, rule_grid
+
+    simulator = VoteSimulator(read_table(FEATURE_DIR, 'resolutions'))
+    thresholds = np.linspace(0.3, 0.8, n_thresholds)
+    rules = rule_grid(thresholds, thresholds, ABSTENTIONS)
+    return simulator.pass_rates, (rules, 'session_id')
+
+
+def db_load_case(_):
+    import insert_data_into_db
+    return insert_data_into_db.run, ()
+
+
+def db_features_case(_):
+    import create_features_in_db
+    return create_features_in_db.run, (True,)
+
+
+def dashboard_case(rerun):
+    # a full script run of the dashboard - every query, cube lookup and chart it builds
+    # the warm case times a rerun, as when a slider moves, after the tables are cached
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(f"{repo_dir}/dashboard.py", default_timeout=3600)
+    if rerun:
+        app.run()
+    return app.run, ()
+
+
+def dashboard_first_chart_case(_):
+    # cold start as a user sees it - seconds from the script starting to the first chart it
+    # hands to streamlit, the imports, the reads the open tab waits for and its first figure
+    import streamlit
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(f"{repo_dir}/dashboard.py", default_timeout=3600)
+    plotly_chart = streamlit.plotly_chart
+    charts = []
+
+    def timed_plotly_chart(*args, **kwargs):
+        charts.append(time.perf_counter())
+        return plotly_chart(*args, **kwargs)
+
+    def first_chart():
+        streamlit.plotly_chart = timed_plotly_chart
+        started = time.perf_counter()
+        app.run()
+        return Measured(seconds=charts[0] - started)
+    return first_chart, ()
+
+
+def dashboard_sections_case(_):
+    # every section of the dashboard opened in turn after the first run, what the whole report
+    # costs now that a run only builds the open tab
+    from streamlit.testing.v1 import AppTest
+    app = AppTest.from_file(f"{repo_dir}/dashboard.py", default_timeout=3600)
+    app.run()
+    labels = [tab.label for tab in app.tabs]
+
+    def open_sections():
+        for label in labels:
+            app.session_state['section'] = label
+            app.run()
+    return open_sections, ()
+
+
+def dashboard_session_memory_case(n_sessions):
+    # memory one more dashboard session holds - a first session opens every section, then
+    # n_sessions more do the same and the python / numpy allocations still held after they ran
+    # (tracemalloc) are split between them. the tables and what is built from them are shared,
+    # what is left is each session's state and rendered output
+    import gc
+    import tracemalloc
+    from streamlit.testing.v1 import AppTest
+
+    def open_session():
+        app = AppTest.from_file(f"{repo_dir}/dashboard.py", default_timeout=3600)
+        app.run()
+        for label in [tab.label for tab in app.tabs]:
+            app.session_state['section'] = label
+            app.run()
+        return app
+
+    def sessions():
+        tracemalloc.start()
+        apps = [open_session()]
+        gc.collect()
+        first = tracemalloc.get_traced_memory()[0]
+        apps += [open_session() for _ in range(n_sessions)]
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return Measured(
+            first_session_mb=first / 1024 ** 2,
+            mb_per_session=(held - first) / n_sessions / 1024 ** 2,
+            sessions=len(apps),
+        )
+    return sessions, ()
+
+
+def service_case(cache_entries, n_clients=16, n_requests=50):
+    # the query service under concurrent load - n_clients keep-alive connections each send
+    # n_requests requests for every endpoint over decade ranges, cache_entries 0 serves all of
+    # them from the db, with a cache most repeat an earlier request
+    import threading
+    import http.client
+    from query_service import QueryService
+
+    service = QueryService(cache_entries=cache_entries)
+    server = service.server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    urls = [
+        f"{path}?start_year={start}&end_year={start + 9}"
+        for path in ['/resolutions', '/sessions', '/conflicts', '/metrics'] for start in range(1900, 2020, 10)
+    ]
+    latencies = []
+
+    def client(offset):
+        conn = http.client.HTTPConnection(host, port)
+        for i in range(n_requests):
+            started = time.perf_counter()
+            conn.request('GET', urls[(offset + i) % len(urls)])
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - started)
+            if response.status != 200:
+                raise RuntimeError(f"{urls[(offset + i) % len(urls)]}: {response.status}")
+        conn.close()
+
+    def load():
+        threads = [threading.Thread(target=client, args=(i * 7,)) for i in range(n_clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        server.shutdown()
+        service.close()
+        if len(latencies) != n_clients * n_requests:
+            raise RuntimeError(f"{n_clients * n_requests - len(latencies)} requests failed")
+        latencies.sort()
+        return Measured(
+            seconds=seconds,
+            requests_per_s=len(latencies) / seconds,
+            p50_ms=latencies[len(latencies) // 2] * 1000,
+            p99_ms=latencies[int(len(latencies) * 0.99)] * 1000,
+        )
+    return load, ()
+
+
+cases = (
+    [(f"clean:{name}", clean_case, name) for name in clean_tables]
+    + [('features:write_all', write_features_case, None)]
+    + [(f"features:{name}", feature_case, name) for name in features]
+    + [('features:statistics', statistics_case, None)]
+    + [('rules:sweep', rules_sweep_case, 51)]
+    + [('db:load', db_load_case, None), ('db:features', db_features_case, None)]
+    + [('dashboard:cold', dashboard_case, False), ('dashboard:warm', dashboard_case, True)]
+    + [('dashboard:first_chart', dashboard_first_chart_case, None)]
+    + [('dashboard:sections', dashboard_sections_case, None)]
+    + [('dashboard:session_memory', dashboard_session_memory_case, 10)]
+    + [('service:uncached', service_case, 0), ('service:cached', service_case, 1024)]
+)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on linux and in bytes on macos
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** (2 if sys.platform == 'darwin' else 1)
+
+
+def measure(case, arg):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        function, args = case(arg)
+        setup_rss = peak_rss_mb()
+        started = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - started
+    measured = result if isinstance(result, Measured) else {}
+    return {'seconds': seconds, 'peak_rss_mb': peak_rss_mb(), 'setup_rss_mb': setup_rss, **measured}
+
+
+def run_isolated(case, arg):
+    # spawned, not forked, so nothing the parent imported or allocated is counted
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(measure, case, arg).result()
+
+
+def commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def prepare(work_dir, scale):
+    # scratch root with the repo's data layout, the raw csvs are generated once per scale
+    root = f"{work_dir}/scale_{scale}"
+    raw = f"{root}/data/raw_data"
+    if not all(os.path.exists(f"{raw}/{name}.csv") for name in clean_tables):
+        generate(raw, scale)
+    for name in ['clean_data', 'feature_data']:
+        os.makedirs(f"{root}/data/{name}", exist_ok=True)
+    return root
+
+
+def run(scales, repeat=1, work_dir=None, output=RESULTS_FILE):
+    import pandas as pd
+
+    work_dir = work_dir or f"{tempfile.gettempdir()}/un_benchmark"
+    context = {
+        'commit': commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+    }
+    cwd = os.getcwd()
+    try:
+        for scale in scales:
+            os.chdir(prepare(work_dir, scale))
+            for stage, case, arg in cases:
+                record = {**context, 'scale': scale, 'stage': stage, 'repeat': repeat}
+                try:
+                    runs = [run_isolated(case, arg) for _ in range(repeat)]
+                except Exception as exc:
+                    record['error'] = repr(exc)
+                    print(f"x{scale} {stage}: failed - {exc!r}")
+                else:
+                    # best time of the repeats, largest memory, the rest of what the case measured
+                    # from its best run
+                    best = min(runs, key=lambda r: r['seconds'])
+                    record.update({
+                        **best,
+                        'peak_rss_mb': max(r['peak_rss_mb'] for r in runs),
+                        'setup_rss_mb': max(r['setup_rss_mb'] for r in runs),
+                    })
+                    extra = ''.join(f", {key} {value:.2f}" for key, value in best.items() if key not in RUN_KEYS)
+                    print(f"x{scale} {stage}: {record['seconds']:.3f}s, peak {record['peak_rss_mb']:.0f} MB{extra}")
+                with open(output, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+    finally:
+        os.chdir(cwd)
+
+
+def compare(old, new, output=RESULTS_FILE):
+    # latest result of every scale and stage for both commits, new / old time ratio
+    latest = {}
+    with open(output) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['commit'] in (old, new) and 'seconds' in record:
+                latest[record['commit'], record['scale'], record['stage']] = record
+
+    print(f"{'scale':>6} {'stage':<30} {old:>10} {new:>10} {'ratio':>7} {'old MB':>8} {'new MB':>8}")
+    keys = sorted({(scale, stage) for _, scale, stage in latest})
+    for scale, stage in keys:
+        before, after = latest.get((old, scale, stage)), latest.get((new, scale, stage))
+        if before is None or after is None:
+            continue
+        ratio = after['seconds'] / before['seconds'] if before['seconds'] else float('nan')
+        print(
+            f"{scale:>6} {stage:<30} {before['seconds']:>10.3f} {after['seconds']:>10.3f} {ratio:>7.2f}"
+            f" {before['peak_rss_mb']:>8.0f} {after['peak_rss_mb']:>8.0f}"
+        )
+
+
+def option_values(name):
+    # values following --name up to the next option
+    if name not in sys.argv:
+        return None
+    values = []
+    for value in sys.argv[sys.argv.index(name) + 1:]:
+        if value.startswith('--'):
+            break
+        values.append(value)
+    return values
+
+
+if __name__ == "__main__":
+    output = (option_values('--output') or [RESULTS_FILE])[0]
+    if '--compare' in sys.argv:
+        compare(*option_values('--compare')[:2], output=output)
+    else:
+        run(
+            [int(scale) for scale in option_values('--scales') or ['1', '10']],
+            repeat=int((option_values('--repeat') or ['1'])[0]),
+            work_dir=(option_values('--work-dir') or [None])[0],
+            output=output,
+        )
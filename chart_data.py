@@ -0,0 +1,49 @@
+import numpy as np
+import plotly.graph_objects as go
+from summary_stats import MAX_BINS, histogram_bins
+
+
+# server side chart data - histograms are binned (summary_stats.histogram_bins) and long line
+# series thinned with numpy before plotly sees them, so a figure carries at most MAX_BINS bars
+# / MAX_POINTS points per trace whatever the number of rows behind it
+
+MAX_POINTS = 1000
+
+
+def histogram(values, x_label, max_bins=MAX_BINS):
+    return histogram_figure(histogram_bins(values, max_bins), x_label)
+
+
+def histogram_figure(bins, x_label):
+    # px.histogram look, drawn from start / end / count bins
+    fig = go.Figure(go.Bar(
+        x=(bins['start'] + bins['end']) / 2, y=bins['count'], width=bins['end'] - bins['start'],
+    ))
+    fig.update_layout(bargap=0, xaxis_title=x_label, yaxis_title='count')
+    return fig
+
+
+def downsample(x, y, max_points=MAX_POINTS):
+    # min / max per bucket of consecutive points, so peaks and dips survive the thinning
+    x, y = np.asarray(x), np.asarray(y, dtype=float)
+    if len(x) <= max_points:
+        return x, y
+
+    n_buckets = max_points // 2
+    bucket = np.arange(len(x)) * n_buckets // len(x)
+    # points by bucket, then by value - each bucket's first point is its min, its last the max
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket, np.arange(n_buckets))
+    ends = np.append(starts[1:], len(x)) - 1
+    keep = np.unique(np.concatenate([order[starts], order[ends]]))
+    return x[keep], y[keep]
+
+
+def line(x, y, name, max_points=MAX_POINTS):
+    x, y = downsample(x, y, max_points)
+    return go.Scatter(x=x, y=y, name=name)
+
+
+def payload_size(fig):
+    # bytes of the figure json the browser receives
+    return len(fig.to_json())
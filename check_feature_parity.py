@@ -0,0 +1,50 @@
+import io
+import sys
+import pandas as pd
+from feature_engine import build_features
+from storage import CLEAN_DIR, read_table
+
+# compares the feature engine output against the feature_data csvs on disk
+# usage: python check_feature_parity.py [feature_data_dir]
+
+reference_dir = sys.argv[1] if len(sys.argv) > 1 else "data/feature_data"
+
+# load clean data
+conflicts = read_table(CLEAN_DIR, 'conflicts')
+resolutions = read_table(CLEAN_DIR, 'resolutions')
+members = read_table(CLEAN_DIR, 'members')
+
+features = build_features(conflicts, resolutions, members)
+
+# member duration depends on the year the reference was built in
+reference_members = pd.read_csv(f"{reference_dir}/members")
+reference_year = int((reference_members['duration'] + reference_members['year_joined']).iloc[0])
+features['members']['duration'] = reference_year - features['members']['year_joined']
+
+n_failed = 0
+for name, df in features.items():
+    reference = pd.read_csv(f"{reference_dir}/{name}")
+    # round trip through csv so both sides are parsed the same way
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    computed = pd.read_csv(buffer)
+
+    if list(computed.columns) != list(reference.columns) or len(computed) != len(reference):
+        print(f"{name}: shape/columns differ {computed.shape} vs {reference.shape}")
+        n_failed += 1
+        continue
+
+    mismatches = {}
+    for col in reference.columns:
+        same = (computed[col] == reference[col]) | (computed[col].isna() & reference[col].isna())
+        if not same.all():
+            mismatches[col] = int((~same).sum())
+
+    if mismatches:
+        print(f"{name}: mismatched rows per column {mismatches}")
+        n_failed += 1
+    else:
+        print(f"{name}: ok ({len(reference)} rows)")
+
+sys.exit(1 if n_failed else 0)
@@ -0,0 +1,260 @@
+import re
+import numpy as np
+import pandas as pd
+from profiling import timed
+
+
+# inverted index from countries and conflicts to the resolutions whose descriptions name them
+# countries are the members plus every other pycountry country, each known by its member
+# name, its pycountry names and the older / short names below. conflicts are known by their
+# name, and are linked to the countries their name mentions (demonyms included), so a
+# conflict -> resolutions lookup is a few sorted-array searches instead of a text scan
+
+# names used in the descriptions that neither the members csv nor pycountry know
+ALIASES = {
+    'Korea': ['KOREA', 'KOREAN'],
+    'Russian Federation': ['RUSSIA', 'USSR', 'U.S.S.R.', 'SOVIET UNION', 'SOVIET'],
+    'United Kingdom of Great Britain and Northern Ireland': ['UK', 'U.K.', 'UNITED KINGDOM', 'GREAT BRITAIN', 'BRITAIN', 'BRITISH', 'ANGLO'],
+    'United States of America': ['US', 'U.S.', 'USA', 'U.S.A.', 'UNITED STATES', 'AMERICAN'],
+    'China': ['CHINESE', 'SINO', "PEOPLE'S REPUBLIC OF CHINA"],
+    'France': ['FRENCH', 'FRANCO'],
+    'Germany': ['GERMAN', 'FEDERAL REPUBLIC OF GERMANY', 'GERMAN DEMOCRATIC REPUBLIC'],
+    'Spain': ['SPANISH'],
+    'Poland': ['POLISH'],
+    'Netherlands': ['DUTCH', 'HOLLAND'],
+    'Greece': ['GREEK'],
+    'Turkey': ['TURKISH', 'TURKO', 'TÜRKIYE', 'TURKIYE'],
+    'Lebanon': ['LEBANESE'],
+    'Afghanistan': ['AFGHAN'],
+    'Cyprus': ['CYPRIOT'],
+    'Finland': ['FINNISH'],
+    'Sweden': ['SWEDISH'],
+    'Denmark': ['DANISH'],
+    'Norway': ['NORWEGIAN'],
+    'Switzerland': ['SWISS'],
+    'Philippines': ['FILIPINO'],
+    'Thailand': ['THAI', 'SIAM'],
+    'Viet Nam': ['VIETNAM', 'VIET-NAM', 'VIETNAMESE'],
+    'Lao People\'s Democratic Republic': ['LAOS', 'LAO'],
+    'Syrian Arab Republic': ['SYRIA'],
+    'United Republic of Tanzania': ['TANZANIA', 'TANGANYIKA', 'ZANZIBAR'],
+    'Republic of Moldova': ['MOLDOVA'],
+    'Democratic People\'s Republic of Korea': ['NORTH KOREA'],
+    'Republic of Korea': ['SOUTH KOREA'],
+    'Democratic Republic of the Congo': ['ZAIRE'],
+    'The former Yugoslav Republic of Macedonia': ['MACEDONIA', 'NORTH MACEDONIA'],
+    'Swaziland': ['ESWATINI'],
+    'Cape Verde': ['CABO VERDE'],
+    'Myanmar': ['BURMA'],
+    'Cambodia': ['KAMPUCHEA'],
+    'Belarus': ['BYELORUSSIA', 'BYELORUSSIAN SSR'],
+    'Ukraine': ['UKRAINIAN SSR'],
+    'Sri Lanka': ['CEYLON'],
+    'Namibia': ['SOUTH WEST AFRICA'],
+    'Zimbabwe': ['RHODESIA', 'SOUTHERN RHODESIA'],
+    'Serbia': ['YUGOSLAVIA'],
+    'Czech Republic': ['CZECHOSLOVAKIA'],
+    'Iran': ['PERSIA'],
+    'El Salvador': ['SALVADOR'],
+    'Falkland Islands (Malvinas)': ['MALVINAS', 'FALKLANDS'],
+}
+
+# alias priority - a name claimed by two entities goes to the one with the lower number,
+# and is dropped when two entities claim it at the same priority (e.g. KOREA)
+MEMBER_NAME, COUNTRY_NAME, SHORT_NAME = 0, 1, 2
+
+
+def pycountry_names(country):
+    # every name pycountry has for a country, "Korea, Republic of" also as "Republic of Korea"
+    names = {
+        getattr(country, attr) for attr in ('name', 'official_name', 'common_name') if hasattr(country, attr)
+    }
+    for name in list(names):
+        if ', ' in name:
+            head, tail = name.split(', ', 1)
+            names.add(f"{tail} {head}")
+    return names
+
+
+def display_name(country):
+    if hasattr(country, 'common_name'):
+        return country.common_name
+    head, _, tail = country.name.partition(', ')
+    return f"{tail} {head}" if tail else head
+
+
+def country_aliases(members):
+    # entity / alias / priority rows, aliases upper case as the descriptions are
+    import pycountry
+
+    member_names = sorted({name.strip() for name in members['country'].astype(str)})
+    rows = [(name, name, MEMBER_NAME) for name in member_names]
+
+    # pycountry countries are joined to members on any of their names
+    by_name = {name.upper(): name for name in member_names}
+    for entity, aliases in ALIASES.items():
+        for alias in aliases:
+            by_name.setdefault(alias, entity)
+    for country in pycountry.countries:
+        names = pycountry_names(country)
+        upper = {name.upper().removeprefix('THE ') for name in names}
+        entity = next((by_name[name] for name in sorted(upper) if name in by_name), display_name(country))
+        rows += [(entity, name, COUNTRY_NAME) for name in names]
+        rows += [(entity, name.split(', ')[0], SHORT_NAME) for name in names if ', ' in name]
+
+    rows += [(entity, alias, COUNTRY_NAME) for entity, aliases in ALIASES.items() for alias in aliases]
+
+    aliases = pd.DataFrame(rows, columns=['entity', 'alias', 'priority'])
+    aliases['alias'] = aliases['alias'].str.upper()
+    aliases = aliases.drop_duplicates(['entity', 'alias'])
+
+    # best priority per alias, names still shared by several entities are ambiguous
+    aliases = aliases[aliases['priority'] == aliases.groupby('alias')['priority'].transform('min')]
+    aliases = aliases[aliases.groupby('alias')['entity'].transform('nunique') == 1]
+    return aliases[['entity', 'alias']].reset_index(drop=True)
+
+
+def stem(alias):
+    # demonyms extend the name, longer names less their final vowel - CUBAN, MEXICAN, CHINESE
+    return re.sub(r'(?<=\w{4})[AEIOSY]$', '', alias)
+
+
+def trie_pattern(words):
+    # alternation of the words as a character trie, re only follows the branch that matches
+    # instead of trying every word at every position - longer words are tried first
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def pattern(node):
+        options = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not options:
+            return ''
+        group = options[0] if len(options) == 1 else '(?:' + '|'.join(options) + ')'
+        return f'(?:{group})?' if '' in node else group
+
+    return pattern(trie)
+
+
+def alias_pattern(aliases, demonyms=False):
+    # whole words only, "SOUTH SUDAN" wins over "SUDAN" - with demonyms an alias also
+    # matches as a word prefix ("CUBAN", "SRI LANKAN")
+    if demonyms:
+        return re.compile(r'(?<![A-Z0-9])(' + trie_pattern({stem(alias) for alias in aliases}) + r'[A-Z]*)')
+    return re.compile(r'(?<![A-Z0-9])(' + trie_pattern(set(aliases)) + r')(?![A-Z0-9])')
+
+
+def find_mentions(texts, aliases, demonyms=False):
+    # (row index, entity) for every entity named in the texts, once per row
+    lookup = dict(zip(aliases['alias'], aliases['entity']))
+    pattern = alias_pattern(aliases['alias'], demonyms)
+    found = texts.str.upper().str.findall(pattern).explode().dropna()
+    if demonyms:
+        # the matched word maps back to the alias whose prefix it starts with
+        stems = sorted(((stem(alias), entity) for alias, entity in lookup.items()), key=lambda pair: -len(pair[0]))
+        entities = found.map(lambda word: next(entity for prefix, entity in stems if word.startswith(prefix)))
+    else:
+        entities = found.map(lookup)
+    mentions = pd.DataFrame({'row': entities.index, 'entity': entities.to_numpy()})
+    return mentions.drop_duplicates().reset_index(drop=True)
+
+
+def resolution_text(resolutions):
+    return resolutions['short_desc'].astype(str).fillna('') + ' | ' + resolutions['long_desc'].fillna('')
+
+
+@timed('feature')
+def resolution_mentions(resolutions, members, conflicts):
+    # entity / kind / resolution_id / year for every country and conflict a description names
+    resolutions = resolutions.reset_index(drop=True)
+    text = resolution_text(resolutions)
+
+    conflict_names = conflicts['conflict'].drop_duplicates()
+    by_kind = {
+        'country': find_mentions(text, country_aliases(members)),
+        'conflict': find_mentions(text, pd.DataFrame({'entity': conflict_names, 'alias': conflict_names.str.upper()})),
+    }
+
+    mentions = pd.concat([found.assign(kind=kind) for kind, found in by_kind.items()], ignore_index=True)
+    mentions['resolution_id'] = resolutions['resolution_id'].to_numpy()[mentions['row']]
+    mentions['year'] = resolutions['year'].to_numpy()[mentions['row']]
+    return sort_mentions(mentions[['entity', 'kind', 'resolution_id', 'year']])
+
+
+def sort_mentions(mentions):
+    # by year, then kind, entity and resolution - as text, categoricals would sort in category order
+    keys = mentions.astype({'kind': str, 'entity': str})
+    order = keys.sort_values(['year', 'kind', 'entity', 'resolution_id'], kind='stable').index
+    return mentions.loc[order].reset_index(drop=True)
+
+
+@timed('feature')
+def merge_resolution_mentions(mentions, new_mentions):
+    # add the mentions of new resolutions, in the order a full build writes them
+    return sort_mentions(pd.concat([
+        mentions.astype({'kind': str, 'entity': str}), new_mentions.astype({'kind': str, 'entity': str}),
+    ], ignore_index=True))
+
+
+@timed('feature')
+def conflict_countries(conflicts, members):
+    # countries named in each conflict's name, "Sino-Japanese War" -> China, Japan
+    conflicts = conflicts.reset_index(drop=True)
+    found = find_mentions(conflicts['conflict'], country_aliases(members), demonyms=True)
+    linked = conflicts.loc[found['row'], ['conflict', 'start', 'end']].reset_index(drop=True)
+    linked['country'] = found['entity'].to_numpy()
+    return linked.drop_duplicates().sort_values(['start', 'conflict', 'country'], kind='stable').reset_index(drop=True)
+
+
+class MentionIndex:
+    # the mentions sorted by kind, entity and year - an entity's resolutions in a year range
+    # are one contiguous slice found with binary searches
+
+    def __init__(self, mentions, conflict_countries):
+        # plain strings, categoricals would sort in category order
+        mentions = mentions.assign(key=mentions['kind'].astype(str) + '\x00' + mentions['entity'].astype(str))
+        mentions = mentions.sort_values(['key', 'year', 'resolution_id'], kind='stable')
+        self.keys = mentions['key'].to_numpy()
+        self.years = mentions['year'].to_numpy()
+        self.resolution_ids = mentions['resolution_id'].to_numpy()
+        self.conflicts = {
+            (conflict, start): (group['end'].iloc[0], group['country'].astype(str).tolist())
+            for (conflict, start), group in conflict_countries.groupby(['conflict', 'start'], sort=False)
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    def resolutions(self, entity, start_year, end_year, kind='country'):
+        key = f"{kind}\x00{entity}"
+        first, last = np.searchsorted(self.keys, key, 'left'), np.searchsorted(self.keys, key, 'right')
+        years = self.years[first:last]
+        lo, hi = np.searchsorted(years, start_year, 'left'), np.searchsorted(years, end_year, 'right')
+        return self.resolution_ids[first + lo:first + hi]
+
+    def countries(self, conflict, start):
+        return self.conflicts.get((conflict, start), (None, []))[1]
+
+    def conflict_resolutions(self, conflict, start, start_year=None, end_year=None):
+        # resolutions naming the conflict, or naming its countries - both of them when it
+        # has two or more, so "Iraq vs UK" does not pull in every resolution about the UK
+        end, countries = self.conflicts.get((conflict, start), (start, []))
+        start_year = start if start_year is None else start_year
+        end_year = end if end_year is None else end_year
+
+        named = self.resolutions(conflict, start_year, end_year, kind='conflict')
+        ids, counts = np.unique(
+            np.concatenate([self.resolutions(country, start_year, end_year) for country in countries] + [named[:0]]),
+            return_counts=True,
+        )
+        keep = counts >= min(2, len(countries))
+        ids, counts = ids[keep], counts[keep]
+
+        result = pd.DataFrame({'resolution_id': np.union1d(ids, named)})
+        result['n_countries'] = 0
+        result.loc[np.searchsorted(result['resolution_id'].to_numpy(), ids), 'n_countries'] = counts
+        result['named'] = np.isin(result['resolution_id'].to_numpy(), named)
+        return result.sort_values(['named', 'n_countries'], ascending=False, kind='stable').reset_index(drop=True)
@@ -1,104 +1,144 @@
-import pandas as pd
-import sqlite3
-from datetime import datetime
-import re
-from pandasql import sqldf
-import pycountry
-
-# pysqlsetup
-pysqldf = lambda q: sqldf(q, globals())
-
-# load clean data
-data_dir = "data/clean_data"
-conflicts = pd.read_csv(f"{data_dir}/conflicts")
-resolutions = pd.read_csv(f"{data_dir}/resolutions")
-members = pd.read_csv(f"{data_dir}/members")
-
-# parse dates
-members['joined_on'] = pd.to_datetime(members['joined_on'], format="%m/%d/%Y")
-resolutions['date'] = pd.to_datetime(resolutions['date'], format="%d/%m/%Y")
-
-# conflict duration
-conflicts['duration'] = conflicts['end'] - conflicts['start']
-conflicts['duration'] = conflicts.duration.apply(lambda x: 1 if x == 0 else x)
-
-# conflict intensity
-conflicts['intensity'] = conflicts['casualties']/conflicts['duration']
-conflicts['intensity'] = conflicts.intensity.apply(lambda x: int(x))
-
-# conflict countries
-# conflicts['countries'] = conflicts['conflict'].apply(lambda x: )
-
-# years as member
-members['duration'] = members.joined_on.apply(lambda x: datetime.now().year - x.year)
-
-# member year joined
-members['year_joined'] = members['joined_on'].apply(lambda x: x.year)
+import os
+import sys
+from feature_engine import (
+    build_features, conflict_features, member_features, resolution_features,
+    resolution_parts, un_sessions, resolution_cube, conflict_cube, resolution_mentions, conflict_countries,
+    resolution_swings, merge_resolution_parts, merge_un_sessions, merge_resolution_cube, merge_resolution_swings,
+    merge_resolution_mentions,
+)
+from incremental import load_watermarks, save_watermarks, file_state, is_unchanged, appended_offset, read_csv_from
+from storage import CLEAN_DIR, FEATURE_DIR, read_table, write_table, append_table, apply_schema
+from summary_stats import STATISTICS_FILE, summary_statistics, write_statistics
 
-# vote margin
-resolutions['vote_margin'] = abs(resolutions['yes'] - resolutions['no'])
+data_dir = CLEAN_DIR
+output_dir = FEATURE_DIR
+outputs = [
+    'conflicts', 'resolutions', 'members', 'resolution_parts', 'un_sessions', 'resolution_cube', 'conflict_cube',
+    'resolution_mentions', 'conflict_countries', 'resolution_swings', STATISTICS_FILE,
+]
 
-# number of members at time of resolution
-resolutions['n_members'] = resolutions.date.apply(lambda x: members[members['joined_on'] < x].count()[1])
 
-# total votes
-resolutions['total_votes'] = resolutions.resolution_id.apply(
-    lambda x: int(resolutions[resolutions['resolution_id'] == x]['yes']) + int(resolutions[resolutions['resolution_id'] == x]['no']) + int(resolutions[resolutions['resolution_id'] == x]['abstain'])
-)
+def load_clean(name, offset=None):
+    # typed clean table, dates already parsed - or only the csv rows after `offset`
+    if offset is None:
+        return read_table(data_dir, name)
+    return apply_schema(read_csv_from(f"{data_dir}/{name}", offset), data_dir, name)
+
 
-# percent abstain
-resolutions['percent_abstain'] = resolutions.resolution_id.apply(
-    lambda x: round(int(resolutions[resolutions['resolution_id'] == x]['abstain']) / int(resolutions[resolutions['resolution_id'] == x]['total_votes']), 2)
-)
+def full_build():
+    # load clean data
+    conflicts = load_clean('conflicts')
+    resolutions = load_clean('resolutions')
+    members = load_clean('members')
+
+    # features - conflicts, resolutions, members, resolution_parts, un_sessions, the aggregate cubes,
+    # the country mention tables (conflict_countries replaces the old per conflict countries) and swings
+    features = build_features(conflicts, resolutions, members)
+
+    # write
+    for name, df in features.items():
+        write_table(df, output_dir, name)
+    write_statistics(summary_statistics(features['conflicts'], features['resolutions'], features['un_sessions']), output_dir)
+    print("rebuilt all features")
 
-# percent yes
-resolutions['percent_yes'] = resolutions.resolution_id.apply(
-    lambda x: round(int(resolutions[resolutions['resolution_id'] == x]['yes']) / int(resolutions[resolutions['resolution_id'] == x]['total_votes']), 2)
-)
 
-# percent no
-resolutions['percent_no'] = resolutions.resolution_id.apply(
-    lambda x: round(int(resolutions[resolutions['resolution_id'] == x]['no']) / int(resolutions[resolutions['resolution_id'] == x]['total_votes']), 2)
-)
+# the feature tables split by the clean tables they read, each group can be built on its own
+def build_conflicts():
+    conflicts = conflict_features(load_clean('conflicts'))
+    write_table(conflicts, output_dir, 'conflicts')
+    write_table(conflict_cube(conflicts), output_dir, 'conflict_cube')
+
+
+def build_members():
+    write_table(member_features(load_clean('members')), output_dir, 'members')
+
+
+def build_resolutions():
+    resolutions = resolution_features(load_clean('resolutions'), load_clean('members'))
+    write_table(resolutions, output_dir, 'resolutions')
+    write_table(resolution_parts(resolutions), output_dir, 'resolution_parts')
+    write_table(un_sessions(resolutions), output_dir, 'un_sessions')
+    write_table(resolution_cube(resolutions), output_dir, 'resolution_cube')
+    write_table(resolution_swings(resolutions), output_dir, 'resolution_swings')
+
+
+def build_mentions():
+    conflicts = load_clean('conflicts')
+    members = load_clean('members')
+    resolutions = load_clean('resolutions')
+    resolutions['year'] = resolutions['date'].dt.year
+    write_table(resolution_mentions(resolutions, members, conflicts), output_dir, 'resolution_mentions')
+    write_table(conflict_countries(conflicts, members), output_dir, 'conflict_countries')
+
+
+def build_statistics():
+    # the statistics artifact of the feature tables on disk
+    tables = [read_table(output_dir, name) for name in ['conflicts', 'resolutions', 'un_sessions']]
+    write_statistics(summary_statistics(*tables), output_dir)
+
+
+def incremental_build(watermarks):
+    # conflict features only depend on conflicts, conflict names are matched in every resolution
+    conflicts_changed = not is_unchanged(f"{data_dir}/conflicts", watermarks.get('conflicts'))
+    if conflicts_changed:
+        build_conflicts()
+        build_mentions()
+        print("conflicts: rebuilt")
+
+    # new rows appended to clean resolutions - feature only those and merge the aggregates
+    watermark = watermarks.get('resolutions')
+    resolutions_changed = not is_unchanged(f"{data_dir}/resolutions", watermark)
+    if resolutions_changed:
+        offset = appended_offset(f"{data_dir}/resolutions", watermark)
+        if offset is None:
+            return False
+
+        members = load_clean('members')
+        new_resolutions = resolution_features(load_clean('resolutions', offset), members)
+        append_table(new_resolutions, output_dir, 'resolutions')
+
+        resolution_parts = read_table(output_dir, 'resolution_parts')
+        write_table(merge_resolution_parts(resolution_parts, new_resolutions), output_dir, 'resolution_parts')
+
+        un_sessions = read_table(output_dir, 'un_sessions')
+        write_table(merge_un_sessions(un_sessions, new_resolutions), output_dir, 'un_sessions')
+
+        cube = read_table(output_dir, 'resolution_cube')
+        write_table(merge_resolution_cube(cube, new_resolutions), output_dir, 'resolution_cube')
+
+        # per resolution tables are merged and rewritten, so their rows stay in full build order
+        swings = read_table(output_dir, 'resolution_swings')
+        write_table(merge_resolution_swings(swings, new_resolutions), output_dir, 'resolution_swings')
+
+        # mentions are per resolution, new rows only add theirs
+        if not conflicts_changed:
+            new_mentions = resolution_mentions(new_resolutions, members, load_clean('conflicts'))
+            mentions = read_table(output_dir, 'resolution_mentions')
+            write_table(merge_resolution_mentions(mentions, new_mentions), output_dir, 'resolution_mentions')
+        print(f"resolutions: appended {len(new_resolutions)} rows")
 
-# resolution passed
-resolutions['resolution_passed'] = resolutions['resolution_id'].apply(
-    lambda x: 1 if (resolutions[resolutions['resolution_id'] == x]['percent_yes'] >= 0.5).item() else 0
-    if (resolutions[resolutions['resolution_id'] == x]['important']).item() == 1
-    else 1 if (resolutions[resolutions['resolution_id'] == x]['percent_yes'] >= 0.66).item() else 0
-)
+    # statistics span both tables and are cheap next to the features, they are rebuilt whole
+    if conflicts_changed or resolutions_changed:
+        build_statistics()
+    return True
 
-# resolution group id
-resolutions['resolution_group_id'] = resolutions.unres.apply(lambda x: f"{x.split('/')[0]}/{x.split('/')[1]}/{re.sub('[A-Z]', '', x.split('/')[2])}" if x is not None and len(x.split("/")) == 3 else x)
-
-# resolution year
-resolutions['year'] = resolutions['date'].apply(lambda x: x.year)
-
-# tbl with number of resolutions per multipart resolution
-resolution_parts = pysqldf("select resolution_group_id, count(*) as n_parts from resolutions group by resolution_group_id")
-
-# un sessions tbl
-un_sessions = pysqldf(
-    """
-    select strftime('%Y',date) as year,
-       count(resolution_id) as n_resolutions,
-       sum(resolution_passed) as n_passed,
-       max(n_members) as n_members,
-       round(cast(sum(resolution_passed) as float) / cast(count(resolution_id) as float), 2) as percent_passed,
-       sum(important) as n_important,
-       session_id
-    from resolutions group by session_id
-    """
-)
 
-# resolutions['long_desc'][resolutions['long_desc'].str.contains('BOER'.upper())]
+def run(incremental=False):
+    watermarks = load_watermarks(output_dir) if incremental else {}
+    outputs_exist = all(os.path.exists(f"{output_dir}/{name}") for name in outputs)
+
+    # member changes shift n_members for every resolution, so they always need a full build
+    if not (
+        incremental
+        and outputs_exist
+        and is_unchanged(f"{data_dir}/members", watermarks.get('members'))
+        and incremental_build(watermarks)
+    ):
+        full_build()
 
+    save_watermarks(output_dir, {name: file_state(f"{data_dir}/{name}") for name in ['conflicts', 'resolutions', 'members']})
 
 
-# write
-output_dir = "data/feature_data"
-conflicts.to_csv(f"{output_dir}/conflicts", index=False)
-resolutions.to_csv(f"{output_dir}/resolutions", index=False)
-members.to_csv(f"{output_dir}/members", index=False)
-resolution_parts.to_csv(f"{output_dir}/resolution_parts", index=False)
-un_sessions.to_csv(f"{output_dir}/un_sessions", index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    # python create_features.py [--incremental]
+    run(incremental='--incremental' in sys.argv)
@@ -1,21 +1,294 @@
-import pandas as pd
+import sys
+import csv
 import sqlite3
+from datetime import datetime
+from storage import CLEAN_DIR, CSV_DATE_FORMATS, SCHEMAS
+from profiling import span
+from feature_engine import PASS_SHARE, pass_bound
+from insert_data_into_db import (
+    db_path, indexes, sqlite_type, create_table_sql, create_index_sql, create_search_index, set_pragmas,
+)
 
-# db connect
-conn = sqlite3.connect('quantium.sqlite')
-cur = conn.cursor()
+# computes the feature tables of create_features.py inside quantium.sqlite with set-based sql
+# source rows come from the clean_conflicts, clean_resolutions and clean_members tables, the
+# outputs replace the conflicts, resolutions, members, resolution_parts, un_sessions and
+# resolution_swings tables. the country mention tables need the text matching of
+# country_mentions.py, they are dropped with the old data - insert_data_into_db.py loads them
+# python create_features_in_db.py [--load-clean]   (--load-clean streams data/clean_data in first)
 
-# add conflict duration to conflicts tbl
-cur.execute(
-    '''
-    ALTER TABLE conflicts ADD COLUMN duration int;
-    '''
-)
-conn.commit()
-cur.execute(
-    '''
-    update conflicts set duration = conflicts.end - conflicts.start where conflicts.end is not null;
-    '''
-)
-conn.commit()
-conn.close()
+clean_tables = ['conflicts', 'resolutions', 'members']
+
+
+def clean_table_sql(name, columns):
+    types = {field.name: sqlite_type(field.type) for field in SCHEMAS[name]}
+    definitions = ', '.join(f'"{col}" {types[col]}' for col in columns)
+    return f'CREATE TABLE "clean_{name}" ({definitions})'
+
+
+def clean_rows(reader, columns):
+    # csv rows with iso dates and NULL for empty fields, one row at a time
+    date_formats = CSV_DATE_FORMATS[CLEAN_DIR]
+    date_cols = [(i, date_formats[col]) for i, col in enumerate(columns) if col in date_formats]
+    for row in reader:
+        row = [value if value != '' else None for value in row]
+        for i, date_format in date_cols:
+            if row[i] is not None:
+                row[i] = datetime.strptime(row[i], date_format).strftime('%Y-%m-%d')
+        yield row
+
+
+def load_clean(cur):
+    # integer / real column affinity converts the csv text on insert
+    for name in clean_tables:
+        with span('db_load', f"clean_{name}"), open(f"{CLEAN_DIR}/{name}", newline='') as f:
+            reader = csv.reader(f)
+            columns = next(reader)
+            cur.execute(f'DROP TABLE IF EXISTS "clean_{name}"')
+            cur.execute(clean_table_sql(name, columns))
+            placeholders = ', '.join('?' * len(columns))
+            cur.executemany(f'INSERT INTO "clean_{name}" VALUES ({placeholders})', clean_rows(reader, columns))
+        print(f"clean_{name}: loaded")
+
+
+def percent_sql(votes, total):
+    # round(votes / total, 2) as python rounds the double - the rational value decides unless it
+    # sits exactly on a tie, then the side of the tie the double landed on does (half even if on it)
+    quotient = f"(100 * {votes}) / {total}"
+    twice_remainder = f"2 * ((100 * {votes}) % {total})"
+    ratio = f"({votes} * 1.0 / {total})"
+    # exact residual votes - ratio * total, ratio split so every product is exact
+    high = f"(cast({ratio} * 1073741824 as integer) / 1073741824.0)"
+    residual = f"(({votes} - {high} * {total}) - ({ratio} - {high}) * {total})"
+    return f"""(
+        {quotient} + case
+            when {twice_remainder} < {total} then 0
+            when {twice_remainder} > {total} then 1
+            when {residual} > 0 then 0
+            when {residual} < 0 then 1
+            else ({quotient}) % 2
+        end
+    ) / 100.0"""
+
+
+def numpy_round_sql(value):
+    # np.round(value, 2) - half even on value * 100
+    scaled = f"(({value}) * 100)"
+    fraction = f"({scaled} - cast({scaled} as integer))"
+    return f"""(
+        cast({scaled} as integer) + case
+            when {fraction} > 0.5 then 1
+            when {fraction} < 0.5 then 0
+            else cast({scaled} as integer) % 2
+        end
+    ) / 100.0"""
+
+
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+DIGITS = '0123456789'
+
+# feature_engine.UNRES_PATTERN without a regex - the symbol is cut at its first two slashes
+# and the number is the rest less its trailing part letters and slashes, symbols of another
+# shape are their own group. one cut per subquery, nested string functions overflow the parser
+symbols_sql = f"""
+    select
+        row_id,
+        case when parsed then body || '/' || session || '/' || number else unres end as resolution_group_id,
+        case when parsed then body end as unres_body,
+        case when parsed then cast(session as integer) end as unres_session,
+        case when parsed then cast(number as integer) end as unres_number,
+        case when parsed then substr(rest, length(number) + 1) end as unres_part
+    from (
+        select
+            *,
+            body <> '' and trim(body, '{LETTERS}') = ''
+            and session <> '' and trim(session, '{DIGITS}') = ''
+            and number <> '' and trim(number, '{DIGITS}') = '' as parsed
+        from (
+            select *, rtrim(rest, '{LETTERS}/') as number
+            from (
+                select
+                    row_id, unres, body,
+                    substr(tail, 1, instr(tail, '/') - 1) as session,
+                    substr(tail, instr(tail, '/') + 1) as rest
+                from (
+                    select
+                        rowid as row_id, unres,
+                        substr(unres, 1, instr(unres, '/') - 1) as body,
+                        substr(unres, instr(unres, '/') + 1) as tail
+                    from clean_resolutions
+                )
+            )
+        )
+    )
+"""
+
+
+feature_sql = {
+    'conflicts': """
+        select
+            conflict, start, "end", casualties, duration,
+            casualties / duration as intensity
+        from (
+            select *, case when "end" - start = 0 then 1 else "end" - start end as duration
+            from clean_conflicts
+        )
+    """,
+    'members': """
+        select
+            country, joined_on,
+            cast(strftime('%Y', 'now', 'localtime') as integer) - year_joined as duration,
+            year_joined
+        from (
+            select *, cast(strftime('%Y', joined_on) as integer) as year_joined
+            from clean_members
+        )
+    """,
+    'resolutions': f"""
+        with events as (
+            -- resolutions sort before members joining on the same day, so the running
+            -- count at a resolution is the members that joined strictly before it
+            select date, 0 as joined, rowid as row_id from clean_resolutions
+            union all
+            select joined_on, 1, null from clean_members
+        ),
+        member_counts as (
+            select row_id, sum(joined) over (
+                order by date, joined rows between unbounded preceding and current row
+            ) as n_members
+            from events
+        ),
+        symbols as ({symbols_sql}),
+        featured as (
+            select
+                r.*,
+                abs(r.yes - r.no) as vote_margin,
+                m.n_members,
+                r.yes + r.no + r.abstain as total_votes,
+                {percent_sql('r.abstain', '(r.yes + r.no + r.abstain)')} as percent_abstain,
+                {percent_sql('r.yes', '(r.yes + r.no + r.abstain)')} as percent_yes,
+                {percent_sql('r.no', '(r.yes + r.no + r.abstain)')} as percent_no,
+                s.resolution_group_id, s.unres_body, s.unres_session, s.unres_number, s.unres_part,
+                cast(strftime('%Y', r.date) as integer) as year,
+                r.rowid as row_id
+            from clean_resolutions r
+            join member_counts m on m.row_id = r.rowid
+            join symbols s on s.row_id = r.rowid
+        )
+        select
+            session_id, resolution_id, abstain, yes, no, important, date, unres, amend, para,
+            short_desc, length, long_desc, vote_margin, n_members, total_votes,
+            percent_abstain, percent_yes, percent_no,
+            percent_yes >= {PASS_SHARE!r} as resolution_passed,
+            resolution_group_id, unres_body, unres_session, unres_number, unres_part, year
+        from featured
+        order by row_id
+    """,
+    'resolution_parts': """
+        select
+            resolution_group_id, count(*) as n_parts, min(unres_body) as unres_body,
+            min(unres_session) as unres_session, min(year) as first_year, max(year) as last_year
+        from resolutions
+        group by resolution_group_id
+    """,
+    'un_sessions': f"""
+        with ranked as (
+            -- year of the (first) resolution with the most members in the session
+            select
+                r.session_id, r.year,
+                row_number() over (partition by r.session_id order by r.n_members desc, c.rowid) as rank
+            from resolutions r
+            join clean_resolutions c using (resolution_id)
+        ),
+        sessions as (
+            select
+                session_id,
+                count(resolution_id) as n_resolutions,
+                sum(resolution_passed) as n_passed,
+                max(n_members) as n_members,
+                sum(important) as n_important
+            from resolutions
+            group by session_id
+        )
+        select
+            ranked.year, n_resolutions, n_passed, n_members,
+            {numpy_round_sql('n_passed * 1.0 / n_resolutions')} as percent_passed,
+            n_important, sessions.session_id
+        from sessions
+        join ranked on ranked.session_id = sessions.session_id and ranked.rank = 1
+        order by sessions.session_id
+    """,
+    # feature_engine.resolution_swings - the fewest yes votes that pass is found among the
+    # counts around pass_bound() of the votes, like min_yes_to_pass, and is 0 without votes
+    'resolution_swings': f"""
+        with candidates as (
+            select resolution_id, total_votes, max(0, min(total_votes, bound + step)) as yes_votes
+            from (select resolution_id, total_votes, cast({pass_bound()!r} * total_votes as integer) as bound from resolutions)
+            cross join (select -1 as step union all select 0 union all select 1 union all select 2)
+        ),
+        needed as (
+            -- candidates grow with the step, the first passing one is the smallest
+            select
+                resolution_id,
+                coalesce(
+                    min(case when {percent_sql('yes_votes', 'total_votes')} >= {PASS_SHARE!r} then yes_votes end),
+                    min(yes_votes)
+                ) as needed
+            from candidates
+            group by resolution_id
+        )
+        select
+            resolution_id, year, short_desc, important, resolution_passed, yes, no, abstain, vote_margin,
+            case when resolution_passed = 1 then yes - needed + 1 else needed - yes end as swing_votes
+        from resolutions
+        join needed using (resolution_id)
+        order by year, swing_votes, resolution_id
+    """,
+}
+
+# built from the old clean data by create_features.py, left out of date by a rebuild here
+stale_tables = ['resolution_mentions', 'conflict_countries']
+
+
+def build_features(cur):
+    # tables in dependency order - resolution_parts and un_sessions read the new resolutions
+    for name, sql in feature_sql.items():
+        columns = ', '.join(f'"{col}"' for col in SCHEMAS[name].names)
+        with span('db_feature', name) as s:
+            cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+            cur.execute(create_table_sql(name))
+            cur.execute(f'INSERT INTO "{name}" ({columns}) {sql}')
+            s.rows_out = cur.rowcount
+            for cols in indexes.get(name, []):
+                cur.execute(create_index_sql(name, cols))
+        print(f"{name}: {cur.execute(f'SELECT count(*) FROM {name}').fetchone()[0]} rows")
+    with span('db_feature', 'resolutions_fts'):
+        create_search_index(cur)
+    for name in stale_tables:
+        cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+    print(f"dropped {', '.join(stale_tables)} - run insert_data_into_db.py after create_features.py to reload them")
+
+
+def run(load_clean_tables=False):
+    # db connect, transactions are managed explicitly
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    set_pragmas(conn)
+    cur = conn.cursor()
+
+    existing = {row[0] for row in cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    load = load_clean_tables or not all(f"clean_{name}" in existing for name in clean_tables)
+
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        if load:
+            load_clean(cur)
+        build_features(cur)
+        cur.execute('COMMIT')
+    except Exception:
+        cur.execute('ROLLBACK')
+        raise
+    cur.execute('ANALYZE')
+    conn.close()
+
+
+if __name__ == "__main__":
+    run(load_clean_tables='--load-clean' in sys.argv)
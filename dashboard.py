@@ -1,640 +1,869 @@
+import math
 import streamlit as st
-import pandas as pd
-import numpy as np
-import altair as alt
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from pandasql import sqldf
+from membership_timeline import MembershipTimeline
+from country_mentions import MentionIndex
+from resolution_groups import ResolutionGroups
+from swing_index import SwingIndex
+from year_cube import YearCube
+from feature_engine import RESOLUTION_CUBE, CONFLICT_CUBE, CASUALTIES_OUTLIER
+from storage import FEATURE_DIR
+from dataset import Dataset, year_rows, memory_report
+from chart_data import histogram_figure, line, payload_size
+from profiling import span
+from voting_rules import ABSTENTIONS, CURRENT_RULE, VoteSimulator, rule_grid, range_pass_rates
+from summary_stats import (
+    STATISTICS_FILE, YEAR_RANGE, read_statistics, conflict_statistics, resolution_statistics, session_statistics,
+)
+
+# cold start - plotly.express, the sql engine and the search index are imported by the
+# sections that use them (plotly.graph_objects comes with streamlit), every table is read
+# on the loader threads at once and each section waits only for the tables it uses, so the
+# open tab draws its first chart while the others are still loading
+# sessions share one read only dataset (dataset.py) - a run only makes views, year slices
+# and the figures of its range, which are cached for every session too
+
+
+# sql setup - full tables live in the persistent engine, the slider range is bound per query
+def query(q, start_year, end_year):
+    from sql_engine import sql_engine
+
+    # copied into the engine on the first query, again only when a table is reloaded
+    for name in ['conflicts', 'resolutions', 'un_sessions']:
+        sql_engine.register(name, dataset.frame(name))
+    return sql_engine.query(q, {'start_year': start_year, 'end_year': end_year})
+
+
+# cube helpers - answered from the per year aggregates, no row level data
+def vote_margin_by_year(start_year, end_year, **where):
+    df = shared(resolution_cube).by_year(start_year, end_year, where=where)
+    df['av_vote_margin'] = df['sum_vote_margin'] / df['n_resolutions']
+    df['n_members'] = df['sum_n_members'] / df['n_resolutions']
+    return df
+
+
+def n_resolutions(start_year, end_year, **where):
+    return shared(resolution_cube).totals(start_year, end_year, where=where)['n_resolutions']
+
+
+def pass_rate(start_year, end_year, **where):
+    # share of the matching resolutions that passed, nan when the range has none
+    n_total = n_resolutions(start_year, end_year, **where)
+    if n_total == 0:
+        return math.nan
+    return n_resolutions(start_year, end_year, resolution_passed=1, **where) / n_total
+
+
+def percent(rate):
+    # a rate as a metric value, "-" when there is none
+    return f"{round(rate * 100, 2)} %" if not math.isnan(rate) else "-"
+
+
+def conflicts_by(dim, start_year, end_year):
+    # conflicts without outliers, started in the year range
+    cube = shared(conflict_cube)
+    if dim == cube.year_col:
+        return cube.by_year(start_year, end_year, where={'outlier': 0})
+    return cube.totals(start_year, end_year, by=[dim], where={'outlier': 0})
+
+
+def plot(fig, key):
+    # charts are keyed - empty ranges give identical figures, which streamlit would otherwise
+    # take for the same element
+    st.plotly_chart(fig, key=key, width='stretch')
+    if show_payload:
+        st.caption(f"chart payload: {payload_size(fig) / 1024:.1f} KB")
+
+
+def cached(build):
+    # what `build` makes of the slider range, built once per range and data version
+    return dataset.cached(build, start_year, end_year)
 
 
-# pysqlsetup
-pysqldf = lambda q: sqldf(q, globals())
+def shared(build):
+    return dataset.shared(build)
+
+
+# shares of yes votes the what-if voting rules can ask for
+RULE_THRESHOLDS = [round(0.3 + i / 100, 2) for i in range(51)]
 
 
 # streamlit setup
 st.set_page_config(layout="wide")
 
 
-# variables
-start_year = 1899
-end_year = 2011
+# variables - the default range is precomputed in the statistics artifact
+start_year, end_year = YEAR_RANGE
 
 
 start_year = st.sidebar.select_slider(
     label='Start Year',
-    options=range(1899, 2012),
+    options=range(YEAR_RANGE[0], YEAR_RANGE[1] + 1),
     value=start_year,
 )
 
 end_year = st.sidebar.select_slider(
     label='End Year',
-    options=range(1899, 2012),
+    options=range(YEAR_RANGE[0], YEAR_RANGE[1] + 1),
     value=end_year,
 )
 
+# bytes each chart sends to the browser, under the chart
+show_payload = st.sidebar.checkbox('Show chart payload sizes', value=False)
+
+# what the server holds once for all sessions
+show_memory = st.sidebar.checkbox('Show shared memory use', value=False)
+
 st.title("Case Study: United Nations Resolutions", )
 
 
-# load data
-data_dir = "data/feature_data"
-conflicts_raw = pd.read_csv(f"{data_dir}/conflicts")
-resolutions = pd.read_csv(f"{data_dir}/resolutions")
-members = pd.read_csv(f"{data_dir}/members")
-resolution_parts = pd.read_csv(f"{data_dir}/resolution_parts")
-un_sessions = pd.read_csv(f"{data_dir}/un_sessions")
+# load data - typed tables are cached across reruns and sessions until their files change,
+# so a slider change only costs the slicing the open section does
+data_dir = FEATURE_DIR
+tables = {
+    'conflicts': None, 'resolutions': None, 'un_sessions': None, 'members': ['joined_on'],
+    'resolution_cube': None, 'conflict_cube': None, 'resolution_mentions': None, 'conflict_countries': None,
+    'resolution_parts': None, 'resolution_swings': None,
+}
+dataset = Dataset(data_dir, tables, files=[STATISTICS_FILE])
 
-# parse dates
-members['joined_on'] = pd.to_datetime(members['joined_on'], format="%Y/%m/%d")
-resolutions['date'] = pd.to_datetime(resolutions['date'], format="%Y/%m/%d")
 
-# remove outliers
-conflicts = conflicts_raw[conflicts_raw['casualties'] < 14000000]
+# shared data - built from the full tables the first time a section needs them
 
-# filter dfs
-conflicts = conflicts[conflicts['start'] >= start_year][conflicts['start'] <= end_year]
-resolutions = resolutions[resolutions['year'] >= start_year][resolutions['year'] <= end_year]
-members = members[members['year_joined'] >= start_year][members['year_joined'] <= end_year]
-un_sessions = un_sessions[un_sessions['year'] >= start_year][un_sessions['year'] <= end_year]
+def membership():
+    # membership timeline over all members, before year filtering
+    return MembershipTimeline(dataset.frame('members'))
 
 
-# body
+def resolution_cube():
+    # per year aggregates for the range charts and counts
+    return YearCube(dataset.frame('resolution_cube'), *RESOLUTION_CUBE[:2])
 
-# resolutions section
 
-st.header("UN Resolutions")
+def conflict_cube():
+    return YearCube(dataset.frame('conflict_cube'), *CONFLICT_CUBE[:2])
 
-st.subheader("Resolutions Passed Over Time")
 
-fig1 = make_subplots(specs=[[{"secondary_y": True}]])
+def mention_index():
+    # countries and conflicts -> the resolutions naming them
+    return MentionIndex(dataset.frame('resolution_mentions'), dataset.frame('conflict_countries'))
 
-# Add traces
-fig1.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_resolutions'], name="N Resolutions"),
-    secondary_y=False,
-)
 
-fig1.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions["percent_passed"], name="% Resolutions Passed"),
-    secondary_y=True,
-)
+def resolution_groups():
+    # multipart resolutions - the parts of a resolution and the per group part counts and years
+    return ResolutionGroups(dataset.frame('resolutions'), dataset.frame('resolution_parts'))
 
-# members vs passed
-fig2 = make_subplots(specs=[[{"secondary_y": True}]])
 
-# Add traces
-fig2.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_members'], name="N Members"),
-    secondary_y=False,
-)
+def swing_index():
+    # resolutions by the fewest vote changes that flip them, over all topics and per topic
+    return SwingIndex(dataset.frame('resolution_swings'))
 
-fig2.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions["percent_passed"], name="% Resolutions Passed"),
-    secondary_y=True,
-)
 
+def vote_simulator():
+    # vote shares of every resolution under each abstention handling, for the what-if rules
+    return VoteSimulator(dataset.frame('resolutions'))
 
-r1Col1, r1Col2 = st.columns(2)
 
-with r1Col1:
-    st.plotly_chart(fig1, use_container_width=True)
+def conflicts_no_outliers():
+    # one filtered copy for every session, still sorted by start year
+    conflicts = dataset.frame('conflicts')
+    return conflicts[conflicts['casualties'] < CASUALTIES_OUTLIER]
 
-with r1Col2:
-    st.plotly_chart(fig2, use_container_width=True)
 
+def statistics():
+    # precomputed correlations, histogram bins, quantiles and top-k tables - None when the
+    # artifact is missing or was computed from other data
+    return read_statistics(data_dir)
 
-st.text('While there appears to be no relation between the volume of resolutions tabled and those that are passed,')
-st.text('the percentage of resolutions passed seems to be positively correlated with the total number of voting members.')
 
-st.subheader("How Close Were the Votes?")
-st.text('Understanding the closeness of votes could give us insight into how unanimous votes were.')
-st.text('Resolutions with low vote margins were wholly agreed upon, whether passed or not and vice versa.')
-st.text('Below we explore how close votes were using a calculated vote margin which is the difference between number of YES and NO  votes.')
-st.text('A higher vote margin indicates a more unanimous decision while those with low margins indicate a more indecisive vote.')
+# section data - every builder takes the year range and returns the frames and figures its
+# section shows, a section is only built when it is open and then cached for the range
 
+def conflict_stats(start_year, end_year):
+    # from the statistics artifact when it covers the range, else from the rows
+    artifact = shared(statistics)
+    stats = artifact and artifact.scope('conflicts', start_year, end_year)
+    return stats or conflict_statistics(year_rows(shared(conflicts_no_outliers), 'start', start_year, end_year))
 
 
-vote_margin_all = px.histogram(
-    resolutions,
-    x='vote_margin',
-)
+def resolution_stats(start_year, end_year):
+    artifact = shared(statistics)
+    stats = artifact and artifact.scope('resolutions', start_year, end_year)
+    return stats or resolution_statistics(dataset.years('resolutions', start_year, end_year), dataset.table('conflicts'))
 
-st.plotly_chart(vote_margin_all, use_container_width=True)
 
-st.caption("Histogram of all vote margins")
-st.text('The above indicates that the majority of votes were unanimous.')
-st.text('Does this view change when looking at resolutions passed and not passed separately?')
+def session_stats(start_year, end_year):
+    artifact = shared(statistics)
+    stats = artifact and artifact.scope('un_sessions', start_year, end_year)
+    return stats or session_statistics(dataset.years('un_sessions', start_year, end_year))
 
 
-vote_margin_passed = px.histogram(
-    resolutions[resolutions['resolution_passed'] == 1],
-    x='vote_margin',
-)
+def sessions_over_time(start_year, end_year):
+    un_sessions = dataset.years('un_sessions', start_year, end_year)
 
-st.plotly_chart(vote_margin_passed, use_container_width=True)
+    fig1 = make_subplots(specs=[[{"secondary_y": True}]])
 
-st.caption("Histogram of all vote margins for resolutions that were passed")
-st.text('The above indicates that the majority of votes where the resolution was passed were unanimous.')
+    # Add traces
+    fig1.add_trace(
+        line(un_sessions['year'], un_sessions['n_resolutions'], "N Resolutions"),
+        secondary_y=False,
+    )
 
-vote_margin_not_passed = px.histogram(
-    resolutions[resolutions['resolution_passed'] == 0],
-    x='vote_margin',
-)
+    fig1.add_trace(
+        line(un_sessions['year'], un_sessions["percent_passed"], "% Resolutions Passed"),
+        secondary_y=True,
+    )
 
-st.plotly_chart(vote_margin_not_passed, use_container_width=True)
+    # members vs passed
+    fig2 = make_subplots(specs=[[{"secondary_y": True}]])
 
-st.caption("Histogram of all vote margins for resolutions that were not passed")
-st.text('The above shows that the majority of votes not passed were not passed with a high margin.')
-st.text('This indicates that resolutions which were not passed, were not passed with very close votes.')
-st.text('This could represent opportunities for swinging the vote by convincing just a few members to change their votes on these resolutions.')
-st.text('More analysis needs to be done on the topics which had a low vote margin to understand how to influence future votes on those topics.')
+    # Add traces
+    fig2.add_trace(
+        line(un_sessions['year'], un_sessions['n_members'], "N Members"),
+        secondary_y=False,
+    )
 
-# vote margin by number of members
-vote_margin_n_members_df = pysqldf(q="select avg(vote_margin) as av_vote_margin, avg(n_members) as n_members, year from resolutions group by year")
-vote_margin_n_members = make_subplots(specs=[[{"secondary_y": False}]])
+    fig2.add_trace(
+        line(un_sessions['year'], un_sessions["percent_passed"], "% Resolutions Passed"),
+        secondary_y=True,
+    )
+    return fig1, fig2
+
+
+def vote_margins(start_year, end_year):
+    # all, passed and not passed resolutions, from the binned vote margins
+    stats = cached(resolution_stats)
+    return [histogram_figure(stats[f'vote_margin_bins_{label}'], 'vote_margin') for label in ['all', 'passed', 'not_passed']]
+
+
+def vote_margins_by_members(start_year, end_year):
+    # vote margin by number of members - all, passed and not passed resolutions
+    figures = []
+    for where in [{}, {'resolution_passed': 1}, {'resolution_passed': 0}]:
+        vote_margin_n_members_df = vote_margin_by_year(start_year, end_year, **where)
+        vote_margin_n_members = make_subplots(specs=[[{"secondary_y": False}]])
+
+        # Add traces
+        vote_margin_n_members.add_trace(
+            line(vote_margin_n_members_df['year'], vote_margin_n_members_df['n_members'], "N Members"),
+            secondary_y=False,
+        )
+        vote_margin_n_members.add_trace(
+            line(vote_margin_n_members_df['year'], vote_margin_n_members_df['av_vote_margin'], "Av. Vote Margin"),
+            secondary_y=False,
+        )
+        figures.append(vote_margin_n_members)
+    return figures
+
+
+def flippable_topics(start_year, end_year, passed):
+    return shared(swing_index).topic_swings(start_year, end_year, passed)
+
+
+def most_flippable(start_year, end_year, topic, passed):
+    return shared(swing_index).most_flippable(start_year, end_year, topic, passed)
+
+
+def voting_rule_sweep(start_year, end_year):
+    # share of the range's resolutions passed for every threshold and abstention handling,
+    # one simulator pass over the whole grid
+    thresholds = RULE_THRESHOLDS
+    rules = rule_grid(thresholds, abstentions=ABSTENTIONS)
+    rates = range_pass_rates(shared(vote_simulator).pass_rates(rules), start_year, end_year).to_numpy()
+
+    fig = go.Figure()
+    for mode in ABSTENTIONS:
+        fig.add_trace(line(thresholds, rates[(rules['abstentions'] == mode).to_numpy()], f"abstentions {mode}"))
+    fig.update_layout(xaxis_title='share of yes votes needed', yaxis_title='share of resolutions passed')
+    return fig
+
+
+def voting_rule_by_year(start_year, end_year, threshold, important_threshold, abstentions):
+    # pass rates per year under one rule next to the rule behind resolution_passed
+    simulator = shared(vote_simulator)
+    totals = []
+    fig = go.Figure()
+    for rules, name in [(CURRENT_RULE, 'Current Rule'), (rule_grid([threshold], [important_threshold], [abstentions]), 'What-If Rule')]:
+        rates = simulator.pass_rates(rules)
+        in_range = rates[rates['year'].between(start_year, end_year)]
+        fig.add_trace(line(in_range['year'], in_range[rules['rule'][0]], name))
+        totals.append(range_pass_rates(rates, start_year, end_year).iloc[0])
+    fig.update_layout(yaxis_title='share of resolutions passed')
+    return fig, totals
+
+
+def multipart_resolutions(start_year, end_year):
+    import plotly.express as px
+
+    groups = shared(resolution_groups)
+    multipart_sessions_df = groups.part_counts_by_session(start_year, end_year)
+    multipart_sessions = px.bar(
+        multipart_sessions_df, x='unres_session', y='n_parts', hover_data=['n_groups', 'first_year'],
+        labels={'unres_session': 'Session', 'n_parts': 'Parts of Multipart Resolutions'},
+    )
+    spanning_groups_df = groups.spanning_years(start_year, end_year)
+    multipart_groups = groups.multipart(start_year, end_year)['resolution_group_id'].tolist()
+    return multipart_sessions, spanning_groups_df, multipart_groups
 
-# Add traces
-vote_margin_n_members.add_trace(
-    go.Scatter(x=vote_margin_n_members_df['year'], y=vote_margin_n_members_df['n_members'], name="N Members"),
-    secondary_y=False,
-)
-vote_margin_n_members.add_trace(
-    go.Scatter(x=vote_margin_n_members_df['year'], y=vote_margin_n_members_df['av_vote_margin'], name="Av. Vote Margin"),
-    secondary_y=False,
-)
 
-st.plotly_chart(vote_margin_n_members, use_container_width=True)
-st.caption("Average vote margin and number of members over time for all resolutions")
+def conflict_figures(start_year, end_year):
+    import plotly.express as px
 
-# vote margin by number of members for passed resolutions
-vote_margin_n_members_df = pysqldf(q="select avg(vote_margin) as av_vote_margin, avg(n_members) as n_members, year from resolutions where resolution_passed = 1 group by year")
-vote_margin_n_members = make_subplots(specs=[[{"secondary_y": False}]])
+    # conflict casualties vs duration
+    casualties_duration_df = conflicts_by('duration', start_year, end_year)
+    casualties_duration_df['av_casualties'] = casualties_duration_df['sum_casualties'] / casualties_duration_df['n_conflicts']
 
-# Add traces
-vote_margin_n_members.add_trace(
-    go.Scatter(x=vote_margin_n_members_df['year'], y=vote_margin_n_members_df['n_members'], name="N Members"),
-    secondary_y=False,
-)
-vote_margin_n_members.add_trace(
-    go.Scatter(x=vote_margin_n_members_df['year'], y=vote_margin_n_members_df['av_vote_margin'], name="Av. Vote Margin"),
-    secondary_y=False,
-)
+    casualties_duration = px.bar(
+        casualties_duration_df,
+        x='duration',
+        y='av_casualties'
+    )
 
-st.plotly_chart(vote_margin_n_members, use_container_width=True)
-st.caption("Average vote margin and number of members over time for passed resolutions")
+    # conflict intensity vs duration
+    intensity_duration_df = conflicts_by('duration', start_year, end_year)
+    intensity_duration_df['av_intensity'] = intensity_duration_df['sum_intensity'] / intensity_duration_df['n_conflicts']
 
-# vote margin by number of members for not passed resolutions
-vote_margin_n_members_df = pysqldf(q="select avg(vote_margin) as av_vote_margin, avg(n_members) as n_members, year from resolutions where resolution_passed = 0 group by year")
-vote_margin_n_members = make_subplots(specs=[[{"secondary_y": False}]])
+    intensity_duration = px.bar(intensity_duration_df, x='duration', y='av_intensity')
 
-# Add traces
-vote_margin_n_members.add_trace(
-    go.Scatter(x=vote_margin_n_members_df['year'], y=vote_margin_n_members_df['n_members'], name="N Members"),
-    secondary_y=False,
-)
-vote_margin_n_members.add_trace(
-    go.Scatter(x=vote_margin_n_members_df['year'], y=vote_margin_n_members_df['av_vote_margin'], name="Av. Vote Margin"),
-    secondary_y=False,
-)
+    # top 10 intense conflicts, by casualties and longest
+    stats = cached(conflict_stats)
+    top_10 = []
+    for measure in ['intensity', 'casualties', 'duration']:
+        top_10_df = stats[f'top_{measure}']
+        top_10_fig = make_subplots(specs=[[{"secondary_y": False}]])
 
-st.plotly_chart(vote_margin_n_members, use_container_width=True)
-st.caption("Average vote margin and number of members over time for resolutions not passed")
-
-st.text('The above 3 graphs gives insight into the relationship between the vote margin and number of voting members.')
-st.text('For passed resolutions, there may be a positive correlation between number of members and vote margin,')
-st.text('this could be a result of the UN becoming more cohesive with increasing number of members,')
-st.text('because an increasing number of members may represent more cohesion among countries and therefore humanitarian values,')
-st.text('represented by decisiveness in voting on resolutions.')
-st.text("This also indicates that when the committee agrees on a matter, they strongly agree.")
-st.text("\n")
-st.text('For resolutions not passed, there seems to be no correlation between number of members and vote margin.')
-st.text("This may indicate that resolutions which split the committee have remained the same over time,")
-st.text("perhaps indicating a world view of those matters which has held over time and among countries.")
-st.text("Interestingly, the last graph may indicate that there is little bias in new member selection")
-st.text("because to maintain the same vote margin over time, new members had to be added in equal proportions")
-st.text("in terms of whether they support contested resolutions or not.")
-
-st.text("\n")
-# top 10 vote margins for passed votes
-st.text("Top 10 Highest Vote Margins for Passed Resolutions")
-top_10_vote_margins_passed_df = pysqldf(q="select vote_margin, short_desc, long_desc from resolutions where resolution_passed = 1 order by vote_margin desc limit 10")
-st.table(top_10_vote_margins_passed_df)
-
-# top 10 vote margins for not passed votes
-st.text("Top 10 Highest Vote Margins for Not Passed Resolutions")
-top_10_vote_margins_not_passed_df = pysqldf(q="select vote_margin, short_desc, long_desc from resolutions where resolution_passed = 0 order by vote_margin desc limit 10")
-st.table(top_10_vote_margins_not_passed_df)
-
-# top 10 lowest vote margins for passed votes
-st.text("Top 10 Lowest Vote Margins for Passed Resolutions")
-top_10_lowest_vote_margins_passed_df = pysqldf(q="select vote_margin, short_desc, long_desc from resolutions where resolution_passed = 1 order by vote_margin asc limit 10")
-st.table(top_10_lowest_vote_margins_passed_df)
-
-# top 10 lowest vote margins for not passed votes
-st.text("Top 10 Lowest Vote Margins for Not Passed Resolutions")
-top_10_lowest_vote_margins_not_passed_df = pysqldf(q="select vote_margin, short_desc, long_desc from resolutions where resolution_passed = 0 order by vote_margin asc limit 10")
-st.table(top_10_lowest_vote_margins_not_passed_df)
-
-
-st.text("\n")
-st.subheader("Exploring the Conflicts")
-
-st.text("\n")
-st.text("We now analyse the conflicts, looking at how they have changed over time and what we can understand about this.")
-st.text("To assist the analysis we calculate a metric, intensity, which is the number of casualties per year.")
-
-# conflict casualties vs duration
-casualties_duration_df = pysqldf(q="select avg(casualties) as av_casualties, duration from conflicts where casualties < 14000000 group by duration")
-
-casualties_duration = px.bar(
-    casualties_duration_df,
-    x='duration',
-    y='av_casualties'
-)
+        # Add traces
+        top_10_fig.add_trace(
+            go.Bar(x=top_10_df['conflict'], y=top_10_df[measure]),
+            secondary_y=False,
+        )
+        top_10.append(top_10_fig)
 
-st.plotly_chart(casualties_duration, use_container_width=True)
-st.caption("Conflict Avg. Casualties by Duration")
-
-# conflict intensity vs duration
-intensity_duration_df = pysqldf(q="select avg(intensity) as av_intensity, duration from conflicts where casualties < 14000000 group by duration")
-
-intensity_duration = px.bar(intensity_duration_df, x='duration', y='av_intensity')
-
-st.plotly_chart(intensity_duration, use_container_width=True)
-st.caption("Conflict Avg. Intensity by Duration")
-
-st.text("The key takeaway from the above 2 figures is that shorter conflicts tend to be more intense,")
-st.text("that is, short conflicts have a higher number of casualties per year.")
-st.text("This may be a result of most conflicts being very intense at the start but the data is lacking to prove this.")
-st.text("This does tell us that the UN needs act decisively and quickly with ending conflicts.")
-
-# # conflict start year vs intensity
-# intensity_start_df = pysqldf(q="select avg(intensity) as av_intensity, start from conflicts where casualties < 14000000 group by start")
-# intensity_start = make_subplots(specs=[[{"secondary_y": False}]])
-#
-# # Add traces
-# intensity_start.add_trace(
-#     go.Scatter(x=intensity_start_df['start'], y=intensity_start_df['av_intensity']),
-#     secondary_y=False,
-# )
-#
-# st.plotly_chart(intensity_start, use_container_width=True)
-# st.caption("Conflict Intensity by Start Year")
-#
-# # conflict start year vs casualties
-# casualties_start_df = pysqldf(q="select avg(casualties) as av_casualties, start from conflicts where casualties < 14000000 group by start")
-# casualties_start = make_subplots(specs=[[{"secondary_y": False}]])
-#
-# # Add traces
-# casualties_start.add_trace(
-#     go.Scatter(x=casualties_start_df['start'], y=casualties_start_df['av_casualties']),
-#     secondary_y=False,
-# )
-#
-# st.plotly_chart(casualties_start, use_container_width=True)
-
-# top 10 intense conflicts
-top_10_intensity_df = pysqldf(q="select conflict, intensity from conflicts where casualties < 14000000 order by intensity desc limit 10")
-top_10_intensity = make_subplots(specs=[[{"secondary_y": False}]])
-
-# Add traces
-top_10_intensity.add_trace(
-    go.Bar(x=top_10_intensity_df['conflict'], y=top_10_intensity_df['intensity']),
-    secondary_y=False,
-)
+    return casualties_duration, intensity_duration, *top_10
 
-st.plotly_chart(top_10_intensity, use_container_width=True)
-st.caption("Top 10 Intense Conflicts - measured by casualties per year")
 
-# top 10 casualties conflicts
-top_10_casualties_df = pysqldf(q="select conflict, casualties from conflicts where casualties < 14000000 order by casualties desc limit 10")
-top_10_casualties = make_subplots(specs=[[{"secondary_y": False}]])
+def conflicts_vs_sessions(start_year, end_year):
+    un_sessions = dataset.years('un_sessions', start_year, end_year)
 
-# Add traces
-top_10_casualties.add_trace(
-    go.Bar(x=top_10_casualties_df['conflict'], y=top_10_casualties_df['casualties']),
-    secondary_y=False,
-)
+    def with_sessions(fig):
+        fig.add_trace(
+            line(un_sessions['year'], un_sessions['n_resolutions'], "N Resolutions"),
+            secondary_y=True,
+        )
 
-st.plotly_chart(top_10_casualties, use_container_width=True)
-st.caption("Top 10 Conflicts by Casualties")
+        fig.add_trace(
+            line(un_sessions['year'], un_sessions['n_passed'], "N Resolutions Passed"),
+            secondary_y=True,
+        )
+        return fig
 
-# top 10 duration conflicts
-top_10_duration_df = pysqldf(q="select conflict, duration from conflicts where casualties < 14000000 order by duration desc limit 10")
-top_10_duration = make_subplots(specs=[[{"secondary_y": False}]])
+    # conflicts start year vs UN sessions
+    conflict_start_count_df = conflicts_by('start', start_year, end_year)
+    conflict_sessions = make_subplots(specs=[[{"secondary_y": True}]])
 
-# Add traces
-top_10_duration.add_trace(
-    go.Bar(x=top_10_duration_df['conflict'], y=top_10_duration_df['duration']),
-    secondary_y=False,
-)
+    # Add traces
+    conflict_sessions.add_trace(
+        line(conflict_start_count_df['start'], conflict_start_count_df['n_conflicts'], "N Conflicts"),
+        secondary_y=False,
+    )
 
-st.plotly_chart(top_10_duration, use_container_width=True)
-st.caption("Top 10 Longest Conflicts")
+    # conflicts end year vs UN sessions
+    conflict_end_count_df = conflicts_by('end', start_year, end_year)
+    conflict_end_sessions = make_subplots(specs=[[{"secondary_y": True}]])
 
-# conflict duration intensity heatmap
+    # Add traces
+    conflict_end_sessions.add_trace(
+        line(conflict_end_count_df['end'], conflict_end_count_df['n_conflicts'], "N Conflicts"),
+        secondary_y=False,
+    )
 
-# duration_intensity_heatmap = px.density_heatmap(conflicts, x="duration", y="casualties")
-# st.plotly_chart(duration_intensity_heatmap, use_container_width=True)
+    # conflicts casualties vs UN sessions
+    conflict_casualties_sum_df = conflicts_by('start', start_year, end_year)
+    conflict_casualties_sum_df['total_casualties'] = conflict_casualties_sum_df['sum_casualties'] / conflict_casualties_sum_df['n_conflicts']
+    conflict_casualties_sessions = make_subplots(specs=[[{"secondary_y": True}]])
 
-st.subheader("UN Sessions & Conflicts - any connection?")
+    # Add traces
+    conflict_casualties_sessions.add_trace(
+        line(conflict_casualties_sum_df['start'], conflict_casualties_sum_df['total_casualties'], "Av. Casualties"),
+        secondary_y=False,
+    )
 
-# conflicts start year vs UN sessions
-conflict_start_count_df = pysqldf(
-    q="""
-    select count(conflict) as n_conflicts, start from conflicts group by start
-    """
-)
-conflict_sessions = make_subplots(specs=[[{"secondary_y": True}]])
+    return with_sessions(conflict_sessions), with_sessions(conflict_end_sessions), with_sessions(conflict_casualties_sessions)
 
-# Add traces
-conflict_sessions.add_trace(
-    go.Scatter(x=conflict_start_count_df['start'], y=conflict_start_count_df['n_conflicts'], name="N Conflicts"),
-    secondary_y=False,
-)
-conflict_sessions.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_resolutions'], name="N Resolutions"),
-    secondary_y=True,
-)
 
-conflict_sessions.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_passed'], name="N Resolutions Passed"),
-    secondary_y=True,
-)
+def linked_conflicts(start_year, end_year):
+    linked = dataset.years('conflicts', start_year, end_year).sort_values('start')
+    return list(linked[['conflict', 'start', 'end']].itertuples(index=False, name=None))
 
-st.text("Conflicts Start Year vs UN Sessions")
-st.plotly_chart(conflict_sessions, use_container_width=True)
 
-# conflicts end year vs UN sessions
-conflict_end_count_df = pysqldf(
-    q="""
-    select count(conflict) as n_conflicts, end from conflicts group by end
-    """
-)
-conflict_end_sessions = make_subplots(specs=[[{"secondary_y": True}]])
+def correlations(start_year, end_year):
+    import plotly.express as px
 
-# Add traces
-conflict_end_sessions.add_trace(
-    go.Scatter(x=conflict_end_count_df['end'], y=conflict_end_count_df['n_conflicts'], name="N Conflicts"),
-    secondary_y=False,
-)
-conflict_end_sessions.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_resolutions'], name="N Resolutions"),
-    secondary_y=True,
-)
+    return {
+        'conflicts': px.imshow(cached(conflict_stats)['corr']),
+        'resolutions': px.imshow(cached(resolution_stats)['corr']),
+        'un_sessions': px.imshow(cached(session_stats)['corr']),
+    }
 
-conflict_end_sessions.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_passed'], name="N Resolutions Passed"),
-    secondary_y=True,
-)
 
-st.text("Conflicts End Year vs UN Sessions")
-st.plotly_chart(conflict_end_sessions, use_container_width=True)
+def case_study(start_year, end_year):
+    answers = {}
 
-st.text("From the above, it can be seen that, for the period of time that the number of conflicts was increasing,")
-st.text("the number of UN resolutions tabled and passed was also increasing, possibly in response to the conflicts.")
-st.text("\n")
-st.text("Interestingly, it could be deduced that the increasing number of resolutions led to a decline in the")
-st.text("number of conflicts in the following years.")
-st.text("This may be a indication that the UN resolutions have been effective in reducing the number of conflicts.")
+    # q2 - top 5% conflicts by intensity
+    answers['top_5_p_casualties'] = cached(resolution_stats)['top_5_p_intensity']
 
+    # q3
+    answers['civil_wars'] = query(
+        q="""
+        select conflict
+        from conflicts
+        where upper(conflict) like '%GOVT%'
+        or upper(conflict) like '%GVT%'
+        or upper(conflict) like '%REBEL%'
+        or upper(conflict) like '%CIVIL%'
+        """,
+        start_year=start_year,
+        end_year=end_year,
+    )
 
-# conflicts casualties vs UN sessions
-conflict_casualties_sum_df = pysqldf(
-    q="""
-    select avg(casualties) as total_casualties, start from conflicts group by start
-    """
-)
-conflict_casualties_sessions = make_subplots(specs=[[{"secondary_y": True}]])
+    # q4
+    decade_resolutions_df = shared(resolution_cube).by_year(start_year, end_year)
+    answers['decade_resolutions'] = (
+        decade_resolutions_df
+        .groupby(decade_resolutions_df['year'] // 10 * 10)['n_resolutions']
+        .sum()
+        .rename_axis('decade')
+        .reset_index()
+        .sort_values('n_resolutions', ascending=False)
+    )
 
-# Add traces
-conflict_casualties_sessions.add_trace(
-    go.Scatter(x=conflict_casualties_sum_df['start'], y=conflict_casualties_sum_df['total_casualties'], name="Av. Casualties"),
-    secondary_y=False,
-)
-conflict_casualties_sessions.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_resolutions'], name="N Resolutions"),
-    secondary_y=True,
-)
+    # q5
+    answers['sessions_passed'] = query(
+        q = """
+        select *
+    from un_sessions
+    where n_resolutions = n_passed
+    and year between :start_year and :end_year
+        """,
+        start_year=start_year,
+        end_year=end_year,
+    )
 
-conflict_casualties_sessions.add_trace(
-    go.Scatter(x=un_sessions['year'], y=un_sessions['n_passed'], name="N Resolutions Passed"),
-    secondary_y=True,
-)
+    # q6 - success rates
+    answers['success_rate'] = pass_rate(start_year, end_year)
+    answers['success_rate_not_important'] = pass_rate(start_year, end_year, important=0)
+    answers['success_rate_important'] = pass_rate(start_year, end_year, important=1)
 
-st.text("Average Casualties per Conflict vs UN Sessions")
-st.plotly_chart(conflict_casualties_sessions, use_container_width=True)
+    # q8
+    answers['membership_growth'] = shared(membership).growth(start_year, end_year)
+    answers['membership_growth_rate'] = shared(membership).annualised_growth_rate(start_year, end_year)
+    answers['top_growth_years'] = shared(membership).top_growth_years(3, start_year, end_year)
+    return answers
 
 
-st.text("\n")
-st.subheader("Correlation Plots")
+# sections - each renders its part of the report from the cached section data
 
-st.plotly_chart(px.imshow(conflicts.corr()), use_container_width=True)
-st.caption("Conflicts")
+def resolutions_section():
+    st.header("UN Resolutions")
 
-st.plotly_chart(px.imshow(resolutions.corr()), use_container_width=True)
-st.caption("Resolutions")
+    st.subheader("Search Resolutions")
+    search_text = st.text_input(
+        label='Search resolution descriptions',
+        placeholder='e.g. refugee*, "human rights", nuclear NOT test',
+    )
 
-st.plotly_chart(px.imshow(resolutions.corr()), use_container_width=True)
-st.caption("UN Sessions")
+    # ranked matches from the full text index in quantium.sqlite, within the year range
+    if search_text.strip():
+        from text_search import search_index
 
-# case study questions
+        if search_index.available():
+            search_results = search_index.search(search_text, start_year, end_year)
+            st.caption(f"{len(search_results)} matching resolutions, best matches first (at most 100)")
+            st.dataframe(search_results, width='stretch')
+        else:
+            st.info("The search index is built by insert_data_into_db.py - run it to enable search.")
 
-st.header("Case Study Questions & Answers")
+    st.subheader("Resolutions Passed Over Time")
+    fig1, fig2 = cached(sessions_over_time)
 
-# q1
-st.subheader("Q1. Which conflict resulted in the greatest number of casualties in the history of the UN?")
-st.metric(
-    label="Conflict with Highest Casualties",
-    value=conflicts_raw["casualties"].max()
-)
+    r1Col1, r1Col2 = st.columns(2)
 
-# q2
-st.subheader("Q2. List the conflicts that are sitting in the top 5% by yearly casualties in the history of the UN.")
-# top 10 casualties conflicts
-n_conflicts = conflicts_raw['conflict'].count()
-top_5_p_casualties_df = pysqldf(
-    q=f"select conflict, casualties from conflicts_raw where start > (select min(year) from resolutions) order by intensity desc limit {int(n_conflicts*0.05)}"
-)
-st.table(top_5_p_casualties_df)
-
-# q3
-st.subheader("Q3. How would you estimate the proportion of historical conflicts that could be referred to as ‘civil war’?")
-st.text("Use key words in the conflict name to identify conflicts which are likely to be civil wars")
-st.text("The below sql query returns the following conflicts as possible civil wars")
-civil_wars_df = pysqldf(
-    q="""
-    select conflict 
-    from conflicts_raw
-    where upper(conflict) like '%GOVT%' 
-    or upper(conflict) like '%GVT%' 
-    or upper(conflict) like '%REBEL%'
-    or upper(conflict) like '%CIVIL%'
-    """
-)
-percent_civil_wars = civil_wars_df['conflict'].count() / conflicts_raw['conflict'].count()
-st.code(
-    body="""
-    select conflict 
-from conflicts 
-where upper(conflict) like '%GOVT%' 
-    or upper(conflict) like '%GVT%' 
-    or upper(conflict) like '%REBEL%'
-    or upper(conflict) like '%CIVIL%'
-    """,
-    language="sql"
-)
+    with r1Col1:
+        plot(fig1, 'resolutions_over_time')
 
-with st.expander("Possible Civil Wars - Click to View"):
-    st.table(civil_wars_df)
+    with r1Col2:
+        plot(fig2, 'members_vs_passed')
 
-st.metric(
-    label="Percentage of Conflicts likely to be Civil Wars",
-    value=f"{round(percent_civil_wars*100, 2)} %"
-)
+    st.text('While there appears to be no relation between the volume of resolutions tabled and those that are passed,')
+    st.text('the percentage of resolutions passed seems to be positively correlated with the total number of voting members.')
 
-# q4
-st.subheader("Q4. Which decade had the greatest number of resolutions proposed?")
-decade_resolutions_df = pysqldf(
-    q="""
-    select
-       cast(substr(cast(year as text), 0, 4) || '0' as integer) as decade, count(resolution_id) as n_resolutions
-from resolutions
-group by decade
-order by n_resolutions desc
-    """
-)
-st.metric(
-    label="Decade with Highest No. of Proposed Resolutions",
-    value=f"{decade_resolutions_df['decade'][decade_resolutions_df['n_resolutions'] == decade_resolutions_df['n_resolutions'].max()].item()}"
-)
-st.metric(
-    label="No. of Proposed Resolutions",
-    value=f"{decade_resolutions_df['n_resolutions'][decade_resolutions_df['n_resolutions'] == decade_resolutions_df['n_resolutions'].max()].item()}"
-)
+    st.subheader("How Close Were the Votes?")
+    st.text('Understanding the closeness of votes could give us insight into how unanimous votes were.')
+    st.text('Resolutions with low vote margins were wholly agreed upon, whether passed or not and vice versa.')
+    st.text('Below we explore how close votes were using a calculated vote margin which is the difference between number of YES and NO  votes.')
+    st.text('A higher vote margin indicates a more unanimous decision while those with low margins indicate a more indecisive vote.')
 
+    vote_margin_all, vote_margin_passed, vote_margin_not_passed = cached(vote_margins)
+    resolution_summary = cached(resolution_stats)
 
-# q5 A
-st.subheader("Q5 A. How many sessions had all the discussed resolutions passed?")
-sessions_passed_df = pysqldf(
-    q = """
-    select *
-from un_sessions
-where n_resolutions = n_passed
-    """
-)
-st.metric(
-    label="No. of Sessions with All Resolutions Passed",
-    value=f"{sessions_passed_df['session_id'].count()}"
-)
+    plot(vote_margin_all, 'vote_margins_all')
+
+    st.caption("Histogram of all vote margins")
+    st.text('The above indicates that the majority of votes were unanimous.')
+    st.text('Does this view change when looking at resolutions passed and not passed separately?')
+
+    plot(vote_margin_passed, 'vote_margins_passed')
+
+    st.caption("Histogram of all vote margins for resolutions that were passed")
+    st.text('The above indicates that the majority of votes where the resolution was passed were unanimous.')
 
+    plot(vote_margin_not_passed, 'vote_margins_not_passed')
 
-# q5 B
-st.subheader("Q5 B. Which of these had the greatest number of important issues discussed?")
-st.text("Both sessions had an equal number of important issues discussed")
-sessions_passed_highest_important = sessions_passed_df[sessions_passed_df['n_important'] == sessions_passed_df['n_important'].max()]
-st.table(sessions_passed_highest_important)
-
-# q6 A
-st.subheader("Q6 A. What has been the success rate of important issues compared to general issues?")
-n_issues_not_important = pysqldf(
-    q="""
-    select count(resolution_id) as count
-from resolutions
-where important = 0
-    """
-)['count'].max()
-
-n_issues_not_important_passed = pysqldf(
-    q="""
-    select count(resolution_id) as count
-from resolutions
-where important = 0
-and resolution_passed = 1
-    """
-)['count'].max()
-
-n_issues_important = pysqldf(
-    q="""
-    select count(resolution_id) as count
-from resolutions
-where important = 1
-    """
-)['count'].max()
-
-n_issues_important_passed = pysqldf(
-    q="""
-    select count(resolution_id) as count
-from resolutions
-where important = 1
-and resolution_passed = 1
-    """
-)['count'].max()
-
-n_issues = pysqldf(
-    q="""
-    select count(resolution_id) as count
-from resolutions
-    """
-)['count'].max()
-
-n_issues_passed = pysqldf(
-    q="""
-    select count(resolution_id) as count
-from resolutions
-where resolution_passed = 1
-    """
-)['count'].max()
-
-success_rate_not_important = n_issues_not_important_passed / n_issues_not_important
-success_rate_important = n_issues_important_passed / n_issues_important
-success_rate = n_issues_passed / n_issues
-
-s_rate_col1, s_rate_col2, s_rate_col3 = st.columns(3)
-
-with s_rate_col1:
+    st.caption("Histogram of all vote margins for resolutions that were not passed")
+    st.text('The above shows that the majority of votes not passed were not passed with a high margin.')
+    st.text('This indicates that resolutions which were not passed, were not passed with very close votes.')
+    st.text('This could represent opportunities for swinging the vote by convincing just a few members to change their votes on these resolutions.')
+    st.text('More analysis needs to be done on the topics which had a low vote margin to understand how to influence future votes on those topics.')
+
+    st.subheader("Which Votes Could Be Swung?")
+    st.text('The vote margin ignores the pass mark, so below we count the fewest members that would have had to change')
+    st.text('their vote to flip each resolution - yes votes turning no or abstain, or no and abstain votes turning yes.')
+    not_passed_only = st.checkbox('Only resolutions not passed', value=True)
+    passed = 0 if not_passed_only else None
+
+    topics_df = dataset.cached(flippable_topics, start_year, end_year, passed)
+    swing_topic = st.selectbox(
+        label='Topic',
+        options=[None] + topics_df['topic'].tolist(),
+        format_func=lambda topic: 'All topics' if topic is None else topic,
+    )
+    st.text("Most Flippable Resolutions")
+    st.table(dataset.cached(most_flippable, start_year, end_year, swing_topic, passed))
+    st.text("Most Flippable Topics")
+    st.dataframe(topics_df, width='stretch')
+
+    st.text("Vote Margin and Share of Yes Votes by Quantile")
+    st.table(resolution_summary['quantiles'])
+
+    captions = [
+        "Average vote margin and number of members over time for all resolutions",
+        "Average vote margin and number of members over time for passed resolutions",
+        "Average vote margin and number of members over time for resolutions not passed",
+    ]
+    for i, (vote_margin_n_members, caption) in enumerate(zip(cached(vote_margins_by_members), captions)):
+        plot(vote_margin_n_members, f'vote_margin_members_{i}')
+        st.caption(caption)
+
+    st.text('The above 3 graphs gives insight into the relationship between the vote margin and number of voting members.')
+    st.text('For passed resolutions, there may be a positive correlation between number of members and vote margin,')
+    st.text('this could be a result of the UN becoming more cohesive with increasing number of members,')
+    st.text('because an increasing number of members may represent more cohesion among countries and therefore humanitarian values,')
+    st.text('represented by decisiveness in voting on resolutions.')
+    st.text("This also indicates that when the committee agrees on a matter, they strongly agree.")
+    st.text("\n")
+    st.text('For resolutions not passed, there seems to be no correlation between number of members and vote margin.')
+    st.text("This may indicate that resolutions which split the committee have remained the same over time,")
+    st.text("perhaps indicating a world view of those matters which has held over time and among countries.")
+    st.text("Interestingly, the last graph may indicate that there is little bias in new member selection")
+    st.text("because to maintain the same vote margin over time, new members had to be added in equal proportions")
+    st.text("in terms of whether they support contested resolutions or not.")
+
+    st.text("\n")
+    st.text("Top 10 Highest Vote Margins for Passed Resolutions")
+    st.table(resolution_summary['highest_vote_margins_passed'])
+    st.text("Top 10 Highest Vote Margins for Not Passed Resolutions")
+    st.table(resolution_summary['highest_vote_margins_not_passed'])
+    st.text("Top 10 Lowest Vote Margins for Passed Resolutions")
+    st.table(resolution_summary['lowest_vote_margins_passed'])
+    st.text("Top 10 Lowest Vote Margins for Not Passed Resolutions")
+    st.table(resolution_summary['lowest_vote_margins_not_passed'])
+
+    st.subheader("What If the Voting Rules Were Different?")
+    st.text('A resolution passes with at least half of the votes cast, abstentions included. Below we replay every vote')
+    st.text('under other rules - another share of yes votes, a separate one for important issues, and abstentions')
+    st.text('counted as votes, ignored, or the share taken of all members at the time.')
+
+    rule_col1, rule_col2, rule_col3 = st.columns(3)
+    with rule_col1:
+        threshold = st.select_slider(label='Yes votes needed', options=RULE_THRESHOLDS, value=0.5)
+    with rule_col2:
+        important_threshold = st.select_slider(label='Yes votes needed, important issues', options=RULE_THRESHOLDS, value=0.5)
+    with rule_col3:
+        abstentions = st.selectbox(label='Abstentions', options=ABSTENTIONS)
+
+    rule_fig, (current_rate, rule_rate) = dataset.cached(
+        voting_rule_by_year, start_year, end_year, threshold, important_threshold, abstentions,
+    )
     st.metric(
-        label="Success Rate All Issues",
-        value=f"{round(success_rate * 100, 2)} %"
+        label="Success Rate Under the What-If Rule",
+        value=f"{round(rule_rate * 100, 2)} %",
+        delta=f"{round((rule_rate - current_rate) * 100, 2)} points",
     )
+    plot(rule_fig, 'voting_rule_by_year')
+    st.caption("Share of resolutions passed per year, current and what-if rule")
 
-with s_rate_col2:
-    st.metric(
-        label="Success Rate Not Important",
-        value=f"{round(success_rate_not_important * 100, 2)} %"
+    plot(cached(voting_rule_sweep), 'voting_rule_sweep')
+    st.caption("Share of resolutions passed by the share of yes votes needed, for each way of counting abstentions")
+
+
+def multipart_section():
+    # multipart resolutions - voted in parts, one record per part, grouped by their UN symbol
+    st.subheader("Multipart Resolutions")
+    multipart_sessions, spanning_groups_df, multipart_groups = cached(multipart_resolutions)
+    plot(multipart_sessions, 'multipart_sessions')
+
+    st.text("Multipart Resolutions Voted Over More Than One Year")
+    st.table(spanning_groups_df)
+
+    multipart_group = st.selectbox(
+        label='Parts of resolution',
+        options=multipart_groups,
     )
+    if multipart_group is not None:
+        st.dataframe(
+            shared(resolution_groups).parts(multipart_group)[
+                ['unres', 'unres_part', 'year', 'short_desc', 'yes', 'no', 'abstain', 'resolution_passed']
+            ],
+            width='stretch',
+        )
+
+
+def conflicts_section():
+    st.subheader("Exploring the Conflicts")
+
+    st.text("\n")
+    st.text("We now analyse the conflicts, looking at how they have changed over time and what we can understand about this.")
+    st.text("To assist the analysis we calculate a metric, intensity, which is the number of casualties per year.")
+
+    casualties_duration, intensity_duration, top_10_intensity, top_10_casualties, top_10_duration = cached(conflict_figures)
+
+    plot(casualties_duration, 'casualties_duration')
+    st.caption("Conflict Avg. Casualties by Duration")
+
+    plot(intensity_duration, 'intensity_duration')
+    st.caption("Conflict Avg. Intensity by Duration")
+
+    st.text("The key takeaway from the above 2 figures is that shorter conflicts tend to be more intense,")
+    st.text("that is, short conflicts have a higher number of casualties per year.")
+    st.text("This may be a result of most conflicts being very intense at the start but the data is lacking to prove this.")
+    st.text("This does tell us that the UN needs act decisively and quickly with ending conflicts.")
+
+    plot(top_10_intensity, 'top_10_intensity')
+    st.caption("Top 10 Intense Conflicts - measured by casualties per year")
+
+    plot(top_10_casualties, 'top_10_casualties')
+    st.caption("Top 10 Conflicts by Casualties")
+
+    plot(top_10_duration, 'top_10_duration')
+    st.caption("Top 10 Longest Conflicts")
+
+
+def sessions_section():
+    st.subheader("UN Sessions & Conflicts - any connection?")
+    conflict_sessions, conflict_end_sessions, conflict_casualties_sessions = cached(conflicts_vs_sessions)
+
+    st.text("Conflicts Start Year vs UN Sessions")
+    plot(conflict_sessions, 'conflict_start_sessions')
 
-with s_rate_col3:
+    st.text("Conflicts End Year vs UN Sessions")
+    plot(conflict_end_sessions, 'conflict_end_sessions')
+
+    st.text("From the above, it can be seen that, for the period of time that the number of conflicts was increasing,")
+    st.text("the number of UN resolutions tabled and passed was also increasing, possibly in response to the conflicts.")
+    st.text("\n")
+    st.text("Interestingly, it could be deduced that the increasing number of resolutions led to a decline in the")
+    st.text("number of conflicts in the following years.")
+    st.text("This may be a indication that the UN resolutions have been effective in reducing the number of conflicts.")
+
+    st.text("Average Casualties per Conflict vs UN Sessions")
+    plot(conflict_casualties_sessions, 'conflict_casualties_sessions')
+
+    # resolutions linked to one conflict - named in the description, or naming its countries
+    st.text("Resolutions Linked to a Conflict")
+    conflicts = cached(linked_conflicts)
+    linked_conflict = st.selectbox(
+        label='Conflict',
+        options=range(len(conflicts)),
+        format_func=lambda i: f"{conflicts[i][0]} ({conflicts[i][1]} - {conflicts[i][2]})",
+    )
+    during_conflict = st.checkbox('Only resolutions passed while the conflict lasted', value=True)
+
+    if linked_conflict is not None:
+        conflict_name, conflict_start, conflict_end = conflicts[linked_conflict]
+        window = (max(start_year, conflict_start), min(end_year, conflict_end)) if during_conflict else (start_year, end_year)
+        index = shared(mention_index)
+        linked = index.conflict_resolutions(conflict_name, conflict_start, *window)
+        linked_resolutions = linked.merge(
+            dataset.table('resolutions')[['resolution_id', 'year', 'short_desc', 'long_desc', 'vote_margin', 'percent_yes', 'resolution_passed']],
+            on='resolution_id',
+        )
+        countries = ', '.join(index.countries(conflict_name, conflict_start)) or 'none recognised'
+        st.caption(f"Countries in the conflict name: {countries} - {len(linked_resolutions)} linked resolutions in {window[0]} - {window[1]}")
+        st.dataframe(linked_resolutions, width='stretch')
+
+
+def correlations_section():
+    st.subheader("Correlation Plots")
+    heatmaps = cached(correlations)
+
+    plot(heatmaps['conflicts'], 'corr_conflicts')
+    st.caption("Conflicts")
+
+    plot(heatmaps['resolutions'], 'corr_resolutions')
+    st.caption("Resolutions")
+
+    plot(heatmaps['un_sessions'], 'corr_un_sessions')
+    st.caption("UN Sessions")
+
+
+def case_study_section():
+    st.header("Case Study Questions & Answers")
+    answers = cached(case_study)
+
+    # q1
+    st.subheader("Q1. Which conflict resulted in the greatest number of casualties in the history of the UN?")
     st.metric(
-        label="Success Rate Important",
-        value=f"{round(success_rate_important * 100, 2)} %"
+        label="Conflict with Highest Casualties",
+        value=dataset.table('conflicts')["casualties"].max()
+    )
+
+    # q2
+    st.subheader("Q2. List the conflicts that are sitting in the top 5% by yearly casualties in the history of the UN.")
+    st.table(answers['top_5_p_casualties'])
+
+    # q3
+    st.subheader("Q3. How would you estimate the proportion of historical conflicts that could be referred to as ‘civil war’?")
+    st.text("Use key words in the conflict name to identify conflicts which are likely to be civil wars")
+    st.text("The below sql query returns the following conflicts as possible civil wars")
+    civil_wars_df = answers['civil_wars']
+    percent_civil_wars = civil_wars_df['conflict'].count() / dataset.table('conflicts')['conflict'].count()
+    st.code(
+        body="""
+    select conflict 
+from conflicts 
+where upper(conflict) like '%GOVT%' 
+    or upper(conflict) like '%GVT%' 
+    or upper(conflict) like '%REBEL%'
+    or upper(conflict) like '%CIVIL%'
+    """,
+        language="sql"
     )
 
-# q6 B
-st.subheader("Q6 B. Based on your analysis of the data so far, what do you think could have driven this?")
-st.text(f"The committe has a very high success rate in general, with the total success rate being {round(success_rate * 100, 2)}%")
+    with st.expander("Possible Civil Wars - Click to View"):
+        st.table(civil_wars_df)
 
-# q7
-st.subheader("Q7. What is the longest time period in years for which no new member joined the United Nations since it was established?")
+    st.metric(
+        label="Percentage of Conflicts likely to be Civil Wars",
+        value=f"{round(percent_civil_wars*100, 2)} %"
+    )
 
-# q8 A
-st.subheader("Q8 A. What is the annualised growth rate in membership for the UN since it was established?")
-un_sessions['member_growth_rate'] = un_sessions['n_members'].pct_change()
-st.table(un_sessions)
+    # q4
+    st.subheader("Q4. Which decade had the greatest number of resolutions proposed?")
+    # sorted most resolutions first, a range without resolutions has no decade
+    decade_resolutions_df = answers['decade_resolutions']
+    top_decade = decade_resolutions_df.iloc[0] if len(decade_resolutions_df) else None
+    st.metric(
+        label="Decade with Highest No. of Proposed Resolutions",
+        value=f"{top_decade['decade']}" if top_decade is not None else "-"
+    )
+    st.metric(
+        label="No. of Proposed Resolutions",
+        value=f"{top_decade['n_resolutions']}" if top_decade is not None else "0"
+    )
 
-# q8 B
-st.subheader("Q8 B. What were the top 3 years with highest growth in membership?")
-gg = pysqldf(
-    q = """
-   select year, member_growth_rate from un_sessions order by member_growth_rate desc limit 3
-    """
-)
-st.table(gg)
+    # q5 A
+    st.subheader("Q5 A. How many sessions had all the discussed resolutions passed?")
+    sessions_passed_df = answers['sessions_passed']
+    st.metric(
+        label="No. of Sessions with All Resolutions Passed",
+        value=f"{sessions_passed_df['session_id'].count()}"
+    )
 
-# q9 A
-st.subheader("Q9 A. Using this data, what attributes would you create to predict the likelihood of a successful resolution?")
-st.plotly_chart(px.imshow(resolutions.corr()), use_container_width=True)
-st.caption("Resolutions Corr Plot")
+    # q5 B
+    st.subheader("Q5 B. Which of these had the greatest number of important issues discussed?")
+    st.text("Both sessions had an equal number of important issues discussed")
+    sessions_passed_highest_important = sessions_passed_df[sessions_passed_df['n_important'] == sessions_passed_df['n_important'].max()]
+    st.table(sessions_passed_highest_important)
+
+    # q6 A
+    st.subheader("Q6 A. What has been the success rate of important issues compared to general issues?")
+    success_rate = answers['success_rate']
+
+    s_rate_col1, s_rate_col2, s_rate_col3 = st.columns(3)
+
+    with s_rate_col1:
+        st.metric(
+            label="Success Rate All Issues",
+            value=percent(success_rate)
+        )
+
+    with s_rate_col2:
+        st.metric(
+            label="Success Rate Not Important",
+            value=percent(answers['success_rate_not_important'])
+        )
+
+    with s_rate_col3:
+        st.metric(
+            label="Success Rate Important",
+            value=percent(answers['success_rate_important'])
+        )
+
+    # q6 B
+    st.subheader("Q6 B. Based on your analysis of the data so far, what do you think could have driven this?")
+    st.text(f"The committe has a very high success rate in general, with the total success rate being {percent(success_rate)}")
+
+    # q7
+    st.subheader("Q7. What is the longest time period in years for which no new member joined the United Nations since it was established?")
+    join_gaps_df = shared(membership).join_gaps(top=5)
+    st.metric(
+        label="Longest Period with No New Member (Years)",
+        value=f"{join_gaps_df['gap_years'].iloc[0]}"
+    )
+    st.table(join_gaps_df.astype({'from': str, 'to': str}))
 
-# q9 B
-st.subheader("Q9 B. What additional information would you request from the UN?")
+    # q8 A
+    st.subheader("Q8 A. What is the annualised growth rate in membership for the UN since it was established?")
+    # over the selected years, a range of one year (or before the first member) has no rate
+    st.metric(
+        label="Annualised Membership Growth Rate",
+        value=percent(answers['membership_growth_rate'])
+    )
+    st.table(answers['membership_growth'])
+
+    # q8 B
+    st.subheader("Q8 B. What were the top 3 years with highest growth in membership?")
+    st.table(answers['top_growth_years'])
+
+    # q9 A - the resolutions heatmap of the correlations section, built once for both
+    st.subheader("Q9 A. Using this data, what attributes would you create to predict the likelihood of a successful resolution?")
+    plot(cached(correlations)['resolutions'], 'q9_corr_resolutions')
+    st.caption("Resolutions Corr Plot")
+
+    # q9 B
+    st.subheader("Q9 B. What additional information would you request from the UN?")
+
+
+# body - one tab per section, switching tabs reruns the script and only the open tab's
+# section runs, so a slider change costs what is on screen rather than the whole report
+sections = {
+    "Resolutions": resolutions_section,
+    "Multipart Resolutions": multipart_section,
+    "Conflicts": conflicts_section,
+    "Sessions & Conflicts": sessions_section,
+    "Correlations": correlations_section,
+    "Case Study Q&A": case_study_section,
+}
+
+for tab, (label, section) in zip(st.tabs(list(sections), key='section', on_change='rerun'), sections.items()):
+    if tab.open:
+        with tab, span('section', label, start_year=start_year, end_year=end_year):
+            section()
+
+if show_memory:
+    memory = memory_report()
+    st.sidebar.caption(
+        f"shared by all sessions: {memory['n_tables']} tables, {memory['tables_mb']:.1f} MB,"
+        f" {memory['n_views']} cached views and figures"
+    )
@@ -1,58 +1,162 @@
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-
-conflicts = pd.read_csv("data/raw_data/conflicts.csv")
-resolutions = pd.read_csv("data/raw_data/resolutions.csv")
-members = pd.read_csv("data/raw_data/members.csv")
+from storage import CLEAN_DIR, TableWriter, compact_dtypes
+from profiling import span, timed
+from incremental import load_watermarks, save_watermarks, file_state, is_unchanged, appended_offset, iter_csv_from
 
 
 def rename_cols(df):
-    col_names = df.columns.format()
-    new_col_names = {}
-    for name in col_names:
-        new_col_names[name] = name.lower().replace(" ", '_')
-
-    return df.rename(columns=new_col_names)
-
-
-conflicts = rename_cols(conflicts)
-resolutions = rename_cols(resolutions)
-members = rename_cols(members)
-
-# members clean up
-
-# remove "note" from name
-members['country'] = members.apply(lambda country: country[0].split("[")[0], axis=1)
-# remove additional info from name
-members['country'] = members.apply(lambda country: country[0].split("(")[0], axis=1)
-
-# resolutions clean up
-resolutions = resolutions.rename(
-    columns={
-        'session': 'session_id',
-        'rcid': 'resolution_id',
-        'abstain': 'abstain',
-        'yes': 'yes',
-        'no': 'no',
-        'importan': 'important',
-        'date': 'date',
-        'unres': 'unres',
-        'amend': 'amend',
-        'para': 'para',
-        'short': 'short_desc',
-        'length': 'length',
-        'descr': 'long_desc'
-    }
-)
-
-# replace "." in important with "0"
-resolutions['important'] = resolutions["important"].apply(lambda x: 0 if x == "." else x)
-
-resolutions['amend'] = resolutions["amend"].apply(lambda x: 0 if x is None else x)
-
-resolutions['para'] = resolutions["para"].apply(lambda x: 0 if x is None else x)
-
-# write
-output_dir = "data/clean_data"
-conflicts.to_csv(f"{output_dir}/conflicts", index=False)
-resolutions.to_csv(f"{output_dir}/resolutions", index=False)
-members.to_csv(f"{output_dir}/members", index=False)
+    return df.rename(columns=lambda name: str(name).lower().replace(" ", '_'))
+
+
+@timed('clean')
+def clean_conflicts(conflicts):
+    return compact_dtypes(rename_cols(conflicts), 'conflicts')
+
+
+@timed('clean')
+def clean_members(members):
+    members = rename_cols(members)
+
+    # members clean up
+
+    # remove "note" and additional info from name - everything from the first "[" or "("
+    members['country'] = members['country'].str.replace(r'[\[(].*', '', regex=True)
+
+    return compact_dtypes(members, 'members')
+
+
+@timed('clean')
+def clean_resolutions(resolutions):
+    resolutions = rename_cols(resolutions)
+
+    # resolutions clean up
+    resolutions = resolutions.rename(
+        columns={
+            'session': 'session_id',
+            'rcid': 'resolution_id',
+            'abstain': 'abstain',
+            'yes': 'yes',
+            'no': 'no',
+            'importan': 'important',
+            'date': 'date',
+            'unres': 'unres',
+            'amend': 'amend',
+            'para': 'para',
+            'short': 'short_desc',
+            'length': 'length',
+            'descr': 'long_desc'
+        }
+    )
+
+    # replace "." in important with "0"
+    resolutions['important'] = pd.to_numeric(resolutions['important'].mask(resolutions['important'] == ".", 0))
+
+    # missing amend / para -> 0
+    resolutions[['amend', 'para']] = resolutions[['amend', 'para']].fillna(0)
+
+    return compact_dtypes(resolutions, 'resolutions')
+
+
+def clean_chunk(clean, chunk):
+    # cleaned chunk with its memory footprint before and after cleaning
+    before = chunk.memory_usage(deep=True).sum()
+    chunk = clean(chunk)
+    return chunk, before, chunk.memory_usage(deep=True).sum()
+
+
+raw_dir = "data/raw_data"
+output_dir = CLEAN_DIR
+
+tables = {
+    'conflicts': (f"{raw_dir}/conflicts.csv", clean_conflicts),
+    'resolutions': (f"{raw_dir}/resolutions.csv", clean_resolutions),
+    'members': (f"{raw_dir}/members.csv", clean_members),
+}
+
+
+# rows per chunk - peak memory is a few chunks whatever the size of the raw file
+chunk_rows = 100000
+
+
+def read_chunks(path, offset=None):
+    # raw rows in chunks, the whole file or only the rows after byte `offset`
+    if offset is None:
+        return pd.read_csv(path, chunksize=chunk_rows)
+    return iter_csv_from(path, offset, chunk_rows)
+
+
+def clean_chunks(chunks, clean, workers=1):
+    # cleaning is row local, so chunks can go to a process pool - at most 2 chunks per
+    # worker are in flight and results come back in input order
+    if workers <= 1:
+        for chunk in chunks:
+            yield clean_chunk(clean, chunk)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(clean_chunk, clean, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_chunks(chunks, name, append=False):
+    # writes the cleaned chunks and reports the memory the raw and cleaned rows took
+    raw_bytes = clean_bytes = 0
+    with TableWriter(output_dir, name, append=append) as writer:
+        for chunk, before, after in chunks:
+            writer.write(chunk)
+            raw_bytes += before
+            clean_bytes += after
+    change = clean_bytes / raw_bytes - 1 if raw_bytes else 0
+    print(f"{name}: memory {raw_bytes / 1e6:.2f} MB raw -> {clean_bytes / 1e6:.2f} MB clean ({change:+.0%})")
+    return writer.n_rows
+
+
+def rebuild(name, workers=1):
+    # full rebuild of one table from its raw file, returns the number of rows written
+    path, clean = tables[name]
+    with span('rebuild', name, workers=workers) as s:
+        s.rows_out = write_chunks(clean_chunks(read_chunks(path), clean, workers), name)
+    return s.rows_out
+
+
+def run(incremental=False, workers=1):
+    watermarks = load_watermarks(output_dir) if incremental else {}
+
+    for name, (path, clean) in tables.items():
+        output_path = f"{output_dir}/{name}"
+        watermark = watermarks.get(name) if os.path.exists(output_path) else None
+
+        # nothing new in the source file
+        if is_unchanged(path, watermark):
+            print(f"{name}: unchanged")
+            continue
+
+        # rows appended to the source file - clean only those and append to the output
+        offset = appended_offset(path, watermark)
+        if offset is not None:
+            n_rows = write_chunks(clean_chunks(read_chunks(path, offset), clean, workers), name, append=True)
+            watermarks[name] = {**file_state(path), 'rows': watermark['rows'] + n_rows}
+            print(f"{name}: appended {n_rows} rows")
+            continue
+
+        # full rebuild
+        n_rows = rebuild(name, workers)
+        watermarks[name] = {**file_state(path), 'rows': n_rows}
+        print(f"{name}: rebuilt {n_rows} rows")
+
+    save_watermarks(output_dir, watermarks)
+
+
+if __name__ == "__main__":
+    # python data_cleaner.py [--incremental] [--workers N]
+    workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else 1
+    run(incremental='--incremental' in sys.argv, workers=workers)
@@ -0,0 +1,56 @@
+import numpy as np
+from storage import YEAR_COLUMNS
+from table_cache import table_cache, prefetch_table, table_stamp, file_stamp
+from view_cache import view_cache
+
+
+# the feature tables as one read only dataset per server process - every session reads the
+# frames of the process wide table cache and shares what is built from them through the view
+# cache, sessions only get views: a year range is a slice of the year sorted rows, not a
+# filtered copy, and with pandas copy on write a session writing to a view copies what it
+# writes, never the shared rows
+
+def year_rows(df, col, start_year, end_year):
+    # rows with `col` in the inclusive range of a frame sorted by `col`, as a view
+    values = df[col].to_numpy()
+    first, last = np.searchsorted(values, start_year, 'left'), np.searchsorted(values, end_year, 'right')
+    return df.iloc[first:last]
+
+
+class Dataset:
+    # `tables` maps table name -> columns to read (None for all), `files` are other files of
+    # the data directory whose changes make a new version - a Dataset is cheap, one is made
+    # per script run and starts reading every table that is not cached yet
+
+    def __init__(self, data_dir, tables, files=()):
+        self.data_dir = data_dir
+        self.version = (
+            tuple(table_stamp(data_dir, name) for name in tables)
+            + tuple(file_stamp(f"{data_dir}/{name}") for name in files)
+        )
+        self.loading = {name: prefetch_table(data_dir, name, columns=columns) for name, columns in tables.items()}
+
+    def frame(self, name):
+        # the shared frame itself, waiting for its read - for code that copies it (the sql
+        # engine) or keeps it as is, everything else takes a view
+        return self.loading[name].result()
+
+    def table(self, name):
+        return self.frame(name).iloc[:]
+
+    def years(self, name, start_year, end_year):
+        return year_rows(self.frame(name), YEAR_COLUMNS[name], start_year, end_year)
+
+    def shared(self, build):
+        # what `build` makes of the full tables, built once per version for every session
+        return view_cache.get(build.__name__, self.version, build)
+
+    def cached(self, build, *args):
+        # what `build` makes of `args`, built once per version and arguments
+        return view_cache.get(build.__name__, self.version, build, *args)
+
+
+def memory_report():
+    # what the process holds once for every session - the cached tables and the number of
+    # views, indexes and section results built from them
+    return {'tables_mb': table_cache.n_bytes / 1024 ** 2, 'n_tables': len(table_cache), 'n_views': len(view_cache)}
@@ -0,0 +1,316 @@
+import pandas as pd
+import numpy as np
+from datetime import datetime
+from membership_timeline import MembershipTimeline
+from country_mentions import resolution_mentions, conflict_countries, merge_resolution_mentions
+from profiling import timed
+
+
+# columnar feature engine - every feature is computed in whole-column passes,
+# no per-row lookups back into the source frames
+
+# conflicts at or above this many casualties are outliers in the dashboard
+CASUALTIES_OUTLIER = 14000000
+
+# share of yes votes a resolution needs to pass, compared with percent_yes (2 decimals)
+PASS_SHARE = 0.5
+
+# aggregate cubes - year column, dimensions and summed measures
+RESOLUTION_CUBE = ('year', ['resolution_passed', 'important'], ['n_resolutions', 'sum_vote_margin', 'sum_n_members'])
+CONFLICT_CUBE = ('start', ['end', 'duration', 'outlier'], ['n_conflicts', 'sum_casualties', 'sum_intensity'])
+
+
+@timed('feature')
+def conflict_features(conflicts):
+    conflicts = conflicts.copy()
+
+    # conflict duration, conflicts starting and ending in the same year count as 1 year
+    duration = (conflicts['end'] - conflicts['start']).to_numpy()
+    conflicts['duration'] = np.where(duration == 0, 1, duration)
+
+    # conflict intensity (casualties per year), truncated like int()
+    intensity = conflicts['casualties'].to_numpy() / conflicts['duration'].to_numpy()
+    conflicts['intensity'] = np.trunc(intensity).astype('int64')
+
+    return conflicts
+
+
+@timed('feature')
+def member_features(members, current_year=None):
+    members = members.copy()
+    current_year = current_year or datetime.now().year
+
+    joined_year = members['joined_on'].dt.year
+
+    # years as member
+    members['duration'] = current_year - joined_year
+
+    # member year joined
+    members['year_joined'] = joined_year
+
+    return members
+
+
+def round_like_python(values, decimals=2):
+    # np.round scales by 10**decimals first and disagrees with round() on values
+    # sitting on a tie, so those few are rounded with the builtin
+    values = np.asarray(values, dtype='float64')
+    rounded = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-9
+    rounded[near_tie] = [round(float(value), decimals) for value in values[near_tie]]
+    return rounded
+
+
+# UN symbol of a resolution, <body>/<session>/<number><part> - "R/33/116A/IV" is part "A/IV"
+# of resolution 116 of session 33, symbols of any other shape are left unparsed
+UNRES_PATTERN = r'^(?P<body>[A-Z]+)/(?P<session>\d+)/(?P<number>\d+)(?P<part>[A-Z/]*)$'
+
+
+def parse_unres(unres):
+    # body / session / number / part strings, NaN where the symbol does not parse
+    return unres.str.extract(UNRES_PATTERN)
+
+
+def resolution_group_ids(unres, symbols):
+    # R/<session>/<number><part> -> R/<session>/<number>, other symbols are kept as is
+    group_ids = symbols['body'] + '/' + symbols['session'] + '/' + symbols['number']
+    return group_ids.where(symbols['body'].notna(), unres)
+
+
+@timed('feature')
+def resolution_features(resolutions, members):
+    resolutions = resolutions.copy()
+    timeline = members if isinstance(members, MembershipTimeline) else MembershipTimeline(members)
+
+    yes = resolutions['yes'].to_numpy()
+    no = resolutions['no'].to_numpy()
+    abstain = resolutions['abstain'].to_numpy()
+
+    # vote margin
+    resolutions['vote_margin'] = np.abs(yes - no)
+
+    # number of members at time of resolution
+    resolutions['n_members'] = timeline.n_members_at(resolutions['date'])
+
+    # total votes
+    total_votes = yes + no + abstain
+    resolutions['total_votes'] = total_votes
+
+    # vote percentages
+    resolutions['percent_abstain'] = round_like_python(abstain / total_votes)
+    resolutions['percent_yes'] = round_like_python(yes / total_votes)
+    resolutions['percent_no'] = round_like_python(no / total_votes)
+
+    # resolution passed
+    # the original per-row rule checked percent_yes >= 0.5 before looking at `important`,
+    # so the 0.66 branch could never pass anything the first check had not already passed -
+    # kept as a simple majority so the published features do not change
+    resolutions['resolution_passed'] = (resolutions['percent_yes'].to_numpy() >= PASS_SHARE).astype('int64')
+
+    # resolution group id and the symbol components, parsed once
+    symbols = parse_unres(resolutions['unres'])
+    resolutions['resolution_group_id'] = resolution_group_ids(resolutions['unres'], symbols)
+    resolutions['unres_body'] = symbols['body']
+    resolutions['unres_session'] = pd.to_numeric(symbols['session']).astype('Int16')
+    resolutions['unres_number'] = pd.to_numeric(symbols['number']).astype('Int32')
+    resolutions['unres_part'] = symbols['part']
+
+    # resolution year
+    resolutions['year'] = resolutions['date'].dt.year
+
+    return resolutions
+
+
+def pass_bound(share=PASS_SHARE, decimals=2):
+    # the lowest rounded share that passes, then the lowest exact share rounding up to it
+    rounded_share = np.ceil(round(share * 10 ** decimals, 6)) / 10 ** decimals
+    return float(rounded_share - 0.5 * 10 ** -decimals)
+
+
+def min_yes_to_pass(total_votes, share=PASS_SHARE, decimals=2):
+    # fewest yes votes out of total_votes whose share, rounded like percent_yes, reaches `share`
+    # - rounding moves the bound by less than a vote, so only the counts around it are checked
+    total = np.asarray(total_votes, dtype='float64')
+    bound = np.floor(pass_bound(share, decimals) * total)
+    candidates = np.clip(bound[:, None] + np.arange(-1, 3), 0, total[:, None])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        passes = round_like_python(candidates / total[:, None], decimals) >= share
+    return candidates[np.arange(len(total)), passes.argmax(axis=1)].astype('int64')
+
+
+@timed('feature')
+def resolution_swings(resolutions):
+    # fewest members changing their vote that flip each resolution under the pass rule - yes
+    # votes turning no or abstain for a passed resolution, no or abstain votes turning yes for
+    # one that failed. the votes cast stay the same, members that did not vote are left out
+    needed = min_yes_to_pass(resolutions['total_votes'].to_numpy())
+    yes = resolutions['yes'].to_numpy().astype('int64')
+    passed = resolutions['resolution_passed'].to_numpy() == 1
+
+    swings = resolutions[[
+        'resolution_id', 'year', 'short_desc', 'important', 'resolution_passed', 'yes', 'no', 'abstain', 'vote_margin',
+    ]].copy()
+    swings['swing_votes'] = np.where(passed, yes - needed + 1, needed - yes)
+    return sort_swings(swings)
+
+
+def sort_swings(swings):
+    # by year, most flippable first within a year
+    return swings.sort_values(['year', 'swing_votes', 'resolution_id'], kind='stable').reset_index(drop=True)
+
+
+@timed('feature')
+def resolution_parts(resolutions):
+    # tbl with number of resolutions per multipart resolution, the session its symbol names
+    # and the years its parts were voted in
+    return (
+        resolutions
+        .groupby('resolution_group_id', sort=True, dropna=False)
+        .agg(
+            n_parts=('resolution_id', 'size'),
+            unres_body=('unres_body', 'first'),
+            unres_session=('unres_session', 'first'),
+            first_year=('year', 'min'),
+            last_year=('year', 'max'),
+        )
+        .reset_index()
+    )
+
+
+@timed('feature')
+def un_sessions(resolutions):
+    grouped = resolutions.groupby('session_id', sort=True)
+
+    # year of the (first) resolution with the most members in the session
+    latest = resolutions.loc[grouped['n_members'].idxmax(), ['session_id', 'date']].set_index('session_id')
+
+    sessions = pd.DataFrame({
+        'year': latest['date'].dt.year,
+        'n_resolutions': grouped['resolution_id'].count(),
+        'n_passed': grouped['resolution_passed'].sum(),
+        'n_members': grouped['n_members'].max(),
+    })
+    sessions['percent_passed'] = (sessions['n_passed'] / sessions['n_resolutions']).round(2)
+    sessions['n_important'] = grouped['important'].sum()
+
+    return sessions.reset_index()[
+        ['year', 'n_resolutions', 'n_passed', 'n_members', 'percent_passed', 'n_important', 'session_id']
+    ]
+
+
+def prefix_sums(cube, year_col, dims, measures):
+    # running totals of every measure over the years, per cell of the other dimensions
+    cube = cube.sort_values(dims + [year_col], kind='stable').reset_index(drop=True)
+    cumulative = cube.groupby(dims, sort=False, dropna=False)[measures].cumsum()
+    for measure in measures:
+        cube[f'cum_{measure}'] = cumulative[measure].to_numpy()
+    return cube
+
+
+@timed('feature')
+def resolution_cube(resolutions):
+    # resolution counts and vote sums per year, passed and important
+    year_col, dims, measures = RESOLUTION_CUBE
+    cube = (
+        resolutions
+        .groupby([year_col] + dims, sort=True)
+        .agg(
+            n_resolutions=('resolution_id', 'count'),
+            sum_vote_margin=('vote_margin', 'sum'),
+            sum_n_members=('n_members', 'sum'),
+        )
+        .reset_index()
+    )
+    return prefix_sums(cube, year_col, dims, measures)
+
+
+@timed('feature')
+def conflict_cube(conflicts):
+    # conflict counts and casualty sums per start year, end year, duration and outlier flag
+    year_col, dims, measures = CONFLICT_CUBE
+    conflicts = conflicts.assign(outlier=(conflicts['casualties'] >= CASUALTIES_OUTLIER).astype('int64'))
+    cube = (
+        conflicts
+        .groupby([year_col] + dims, sort=True, dropna=False)
+        .agg(
+            n_conflicts=('conflict', 'count'),
+            sum_casualties=('casualties', 'sum'),
+            sum_intensity=('intensity', 'sum'),
+        )
+        .reset_index()
+    )
+    return prefix_sums(cube, year_col, dims, measures)
+
+
+@timed('feature')
+def build_features(conflicts, resolutions, members):
+    # full feature set from parsed clean data
+    conflicts = conflict_features(conflicts)
+    members = member_features(members)
+    resolutions = resolution_features(resolutions, members)
+
+    return {
+        'conflicts': conflicts,
+        'resolutions': resolutions,
+        'members': members,
+        'resolution_parts': resolution_parts(resolutions),
+        'un_sessions': un_sessions(resolutions),
+        'resolution_cube': resolution_cube(resolutions),
+        'conflict_cube': conflict_cube(conflicts),
+        'resolution_mentions': resolution_mentions(resolutions, members, conflicts),
+        'conflict_countries': conflict_countries(conflicts, members),
+        'resolution_swings': resolution_swings(resolutions),
+    }
+
+
+@timed('feature')
+def merge_resolution_parts(parts, new_resolutions):
+    # add the part counts of new resolutions, only their groups are touched
+    new_parts = resolution_parts(new_resolutions)
+    merged = pd.concat([parts, new_parts]).groupby('resolution_group_id', sort=True, dropna=False).agg(
+        n_parts=('n_parts', 'sum'),
+        unres_body=('unres_body', 'first'),
+        unres_session=('unres_session', 'first'),
+        first_year=('first_year', 'min'),
+        last_year=('last_year', 'max'),
+    )
+    return merged.reset_index()
+
+
+@timed('feature')
+def merge_un_sessions(sessions, new_resolutions):
+    # fold the aggregates of new resolutions into the sessions they belong to
+    new_sessions = un_sessions(new_resolutions)
+    affected = sessions['session_id'].isin(new_sessions['session_id'])
+    combined = pd.concat([sessions[affected], new_sessions], ignore_index=True)
+    grouped = combined.groupby('session_id', sort=True)
+
+    # existing rows come first so they keep the year on ties, as in a full rebuild
+    merged = pd.DataFrame({
+        'year': combined.loc[grouped['n_members'].idxmax()].set_index('session_id')['year'],
+        'n_resolutions': grouped['n_resolutions'].sum(),
+        'n_passed': grouped['n_passed'].sum(),
+        'n_members': grouped['n_members'].max(),
+    })
+    merged['percent_passed'] = (merged['n_passed'] / merged['n_resolutions']).round(2)
+    merged['n_important'] = grouped['n_important'].sum()
+    merged = merged.reset_index()[sessions.columns]
+
+    return pd.concat([sessions[~affected], merged]).sort_values('session_id').reset_index(drop=True)
+
+
+@timed('feature')
+def merge_resolution_swings(swings, new_resolutions):
+    # add the swings of new resolutions, in the order a full build writes them
+    new_swings = resolution_swings(new_resolutions)
+    return sort_swings(pd.concat([swings.astype({'short_desc': str}), new_swings.astype({'short_desc': str})], ignore_index=True))
+
+
+@timed('feature')
+def merge_resolution_cube(cube, new_resolutions):
+    # add the sums of new resolutions to their cells and redo the running totals
+    year_col, dims, measures = RESOLUTION_CUBE
+    combined = pd.concat([cube, resolution_cube(new_resolutions)], ignore_index=True)
+    sums = combined.groupby([year_col] + dims, sort=True)[measures].sum().reset_index()
+    return prefix_sums(sums, year_col, dims, measures)
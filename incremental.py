@@ -0,0 +1,81 @@
+import os
+import io
+import json
+import hashlib
+import pandas as pd
+
+
+# watermarks for incremental runs - one json file per output dir, recording the
+# size, content hash and row count of every source file the last run consumed
+
+WATERMARK_FILE = ".watermarks.json"
+CHUNK_SIZE = 1 << 20
+
+
+def file_hash(path, size=None):
+    # sha256 of the first `size` bytes of the file (the whole file by default)
+    digest = hashlib.sha256()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def file_state(path):
+    return {'size': os.path.getsize(path), 'sha256': file_hash(path)}
+
+
+def load_watermarks(output_dir):
+    path = f"{output_dir}/{WATERMARK_FILE}"
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_watermarks(output_dir, watermarks):
+    with open(f"{output_dir}/{WATERMARK_FILE}", 'w') as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+
+
+def is_unchanged(path, watermark):
+    return watermark is not None and file_state(path) == {k: watermark.get(k) for k in ('size', 'sha256')}
+
+
+def appended_offset(path, watermark):
+    # byte offset where new rows start if the file only had rows appended since the
+    # watermark, otherwise None (file rewritten or truncated -> full rebuild)
+    if watermark is None:
+        return None
+    size = watermark['size']
+    if os.path.getsize(path) <= size or size == 0:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        if f.read(1) != b'\n':
+            return None
+    if file_hash(path, size) != watermark['sha256']:
+        return None
+    return size
+
+
+def read_csv_from(path, offset, **kwargs):
+    # rows after `offset`, parsed with the header of the file
+    columns = pd.read_csv(path, nrows=0).columns
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        tail = f.read()
+    return pd.read_csv(io.BytesIO(tail), header=None, names=columns, **kwargs)
+
+
+def iter_csv_from(path, offset, chunksize, **kwargs):
+    # rows after `offset` in chunks of `chunksize` rows, the tail is never read in one go
+    columns = pd.read_csv(path, nrows=0).columns
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        yield from pd.read_csv(f, header=None, names=columns, chunksize=chunksize, **kwargs)
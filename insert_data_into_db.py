@@ -1,26 +1,131 @@
-import pandas as pd
 import sqlite3
+import pyarrow as pa
+from storage import FEATURE_DIR, SCHEMAS, read_table
+from profiling import span
 
-# db connect
-conn = sqlite3.connect('quantium.sqlite')
-cur = conn.cursor()
-
-# load clean data
-data_dir = "data/feature_data"
-conflicts = pd.read_csv(f"{data_dir}/conflicts")
-resolutions = pd.read_csv(f"{data_dir}/resolutions")
-members = pd.read_csv(f"{data_dir}/members")
-resolution_parts = pd.read_csv(f"{data_dir}/resolution_parts")
-un_sessions = pd.read_csv(f"{data_dir}/un_sessions")
-
-# parse dates
-members['joined_on'] = pd.to_datetime(members['joined_on'], format="%Y/%m/%d")
-resolutions['date'] = pd.to_datetime(resolutions['date'], format="%Y/%m/%d")
-
-# create tables
-conflicts.to_sql('conflicts', conn, if_exists='replace', index=False)
-resolutions.to_sql('resolutions', conn, if_exists='replace', index=False)
-members.to_sql('members', conn, if_exists='replace', index=False)
-resolution_parts.to_sql('resolution_parts', conn, if_exists='replace', index=False)
-un_sessions.to_sql('un_sessions', conn, if_exists='replace', index=False)
+# loads the feature tables into quantium.sqlite with declared column types, keys and indexes
+# every table is dropped, recreated and bulk inserted in a single transaction, so the
+# script can be re-run after a data update and readers never see a half loaded db
 
+db_path = 'quantium.sqlite'
+data_dir = FEATURE_DIR
+page_size = 8192
+
+primary_keys = {
+    'conflicts': ['conflict', 'start'],
+    'resolutions': ['resolution_id'],
+    'members': ['country'],
+    'resolution_parts': ['resolution_group_id'],
+    'un_sessions': ['session_id'],
+    'resolution_mentions': ['kind', 'entity', 'resolution_id'],
+    'conflict_countries': ['conflict', 'start', 'country'],
+    'resolution_swings': ['resolution_id'],
+}
+
+indexes = {
+    'conflicts': [['start'], ['end'], ['duration']],
+    'resolutions': [['year'], ['session_id'], ['resolution_passed', 'year'], ['resolution_group_id', 'unres_part'], ['important']],
+    'resolution_parts': [['unres_session'], ['first_year', 'last_year']],
+    'members': [['year_joined'], ['joined_on']],
+    'un_sessions': [['year']],
+    'resolution_mentions': [['kind', 'entity', 'year'], ['resolution_id']],
+    'conflict_countries': [['country']],
+    # most flippable first - over all topics, and within a topic
+    'resolution_swings': [['swing_votes', 'year'], ['short_desc', 'swing_votes'], ['year']],
+}
+
+
+def sqlite_type(arrow_type):
+    if pa.types.is_integer(arrow_type):
+        return 'INTEGER'
+    if pa.types.is_floating(arrow_type):
+        return 'REAL'
+    # dates are stored as iso text, categoricals as their values
+    return 'TEXT'
+
+
+def create_table_sql(name):
+    columns = [f'"{field.name}" {sqlite_type(field.type)}' for field in SCHEMAS[name]]
+    key = ', '.join(f'"{col}"' for col in primary_keys[name])
+    return f'CREATE TABLE "{name}" ({", ".join(columns)}, PRIMARY KEY ({key}))'
+
+
+def create_index_sql(name, cols):
+    columns = ', '.join(f'"{col}"' for col in cols)
+    return f'CREATE INDEX "{name}_{"_".join(cols)}" ON "{name}" ({columns})'
+
+
+def create_search_index(cur):
+    # external content fts5 index over the resolution text - the text itself stays in
+    # resolutions, fts rowids are resolution ids. stemmed words, prefix indexes for 2 and 3
+    # characters so short prefix queries do not scan the whole term list
+    cur.execute('DROP TABLE IF EXISTS "resolutions_fts"')
+    cur.execute(
+        """CREATE VIRTUAL TABLE "resolutions_fts" USING fts5(
+            short_desc, long_desc,
+            content='resolutions', content_rowid='resolution_id',
+            tokenize='porter unicode61', prefix='2 3'
+        )"""
+    )
+    cur.execute("""INSERT INTO "resolutions_fts" ("resolutions_fts") VALUES ('rebuild')""")
+
+
+def rows(df, name):
+    # plain python values in schema column order - iso dates, None for missing values
+    df = df[SCHEMAS[name].names].copy()
+    for field in SCHEMAS[name]:
+        if pa.types.is_date(field.type):
+            df[field.name] = df[field.name].dt.strftime('%Y-%m-%d')
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def set_pragmas(conn):
+    # page size of an existing db only changes on a vacuum outside wal mode
+    if conn.execute('PRAGMA page_size').fetchone()[0] != page_size:
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.execute(f'PRAGMA page_size = {page_size}')
+        conn.execute('VACUUM')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA cache_size = -65536')
+
+
+def load(conn, tables):
+    cur = conn.cursor()
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        for name, df in tables.items():
+            with span('db_load', name) as s:
+                s.rows_in = len(df)
+                cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+                cur.execute(create_table_sql(name))
+                placeholders = ', '.join('?' * len(SCHEMAS[name]))
+                cur.executemany(f'INSERT INTO "{name}" VALUES ({placeholders})', rows(df, name))
+                # indexes after the insert, one sorted build instead of per-row updates
+                for cols in indexes.get(name, []):
+                    cur.execute(create_index_sql(name, cols))
+            print(f"{name}: loaded {len(df)} rows")
+        if 'resolutions' in tables:
+            with span('db_load', 'resolutions_fts'):
+                create_search_index(cur)
+        cur.execute('COMMIT')
+    except Exception:
+        cur.execute('ROLLBACK')
+        raise
+    cur.execute('ANALYZE')
+
+
+def run():
+    # db connect, transactions are managed explicitly
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    set_pragmas(conn)
+
+    # load feature data - typed, dates already parsed
+    tables = {name: read_table(data_dir, name) for name in primary_keys}
+    load(conn, tables)
+    conn.close()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,63 @@
+import pandas as pd
+import numpy as np
+
+
+# sorted join dates of the members tbl, built once and queried for many dates at a time
+class MembershipTimeline:
+
+    def __init__(self, members, date_col='joined_on'):
+        self.joined_on = np.sort(pd.to_datetime(members[date_col]).dropna().to_numpy())
+
+    def __len__(self):
+        return len(self.joined_on)
+
+    def n_members_at(self, dates):
+        # members that joined strictly before each date
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+        return np.searchsorted(self.joined_on, dates, side='left')
+
+    def n_members_by_year(self, start_year=None, end_year=None):
+        # members at the end of each year
+        years = pd.DatetimeIndex(self.joined_on).year
+        # no members before the first join
+        start_year = max(start_year or int(years.min()), int(years.min()))
+        end_year = end_year or int(years.max())
+        year_range = np.arange(start_year, end_year + 1)
+        year_ends = pd.to_datetime([f"{year + 1}-01-01" for year in year_range])
+        return pd.DataFrame({'year': year_range, 'n_members': self.n_members_at(year_ends)})
+
+    def join_gaps(self, top=None, until=None):
+        # periods between consecutive joins, longest first
+        join_dates = np.unique(self.joined_on)
+        if until is not None:
+            join_dates = np.append(join_dates, np.datetime64(pd.Timestamp(until)))
+
+        gaps = pd.DataFrame({'from': join_dates[:-1], 'to': join_dates[1:]})
+        gaps['gap_days'] = (gaps['to'] - gaps['from']).dt.days
+        gaps['gap_years'] = (gaps['gap_days'] / 365.25).round(2)
+        gaps = gaps.sort_values('gap_days', ascending=False, kind='stable').reset_index(drop=True)
+
+        return gaps if top is None else gaps.head(top)
+
+    def growth(self, start_year=None, end_year=None):
+        # year on year growth in membership
+        growth = self.n_members_by_year(start_year, end_year)
+        growth['n_joined'] = growth['n_members'].diff()
+        growth['member_growth_rate'] = growth['n_members'].pct_change()
+        return growth
+
+    def top_growth_years(self, k=3, start_year=None, end_year=None):
+        growth = self.growth(start_year, end_year)
+        return growth.nlargest(k, 'member_growth_rate')[['year', 'n_joined', 'member_growth_rate']].reset_index(drop=True)
+
+    def annualised_growth_rate(self, start_year=None, end_year=None):
+        # compound annual growth in membership between the end of start_year and end_year
+        by_year = self.n_members_by_year(start_year, end_year)
+        if by_year.empty:
+            return np.nan
+        n_start = by_year['n_members'].iloc[0]
+        n_end = by_year['n_members'].iloc[-1]
+        n_years = by_year['year'].iloc[-1] - by_year['year'].iloc[0]
+        if n_start == 0 or n_years == 0:
+            return np.nan
+        return (n_end / n_start) ** (1 / n_years) - 1
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import importlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from profiling import span
+
+# single entry point for clean -> features -> load
+# every stage declares the files it reads and writes and the modules its code lives in,
+# a stage runs after the stages that write its inputs and independent stages run side by
+# side in a process pool. a stage is skipped when the hash of its code and inputs matches
+# the last successful run and its outputs are still the files that run wrote
+# python pipeline.py [--in-db] [--force] [--workers N]
+#   --in-db   computes the features inside quantium.sqlite instead of data/feature_data
+#   --force   runs every stage, ignoring the cache
+# with QUANTIUM_PROFILE=<file> set every stage and the feature functions inside it are timed
+
+CACHE_FILE = ".pipeline_cache.json"
+
+raw_dir = "data/raw_data"
+clean_dir = "data/clean_data"
+feature_dir = "data/feature_data"
+db_path = "quantium.sqlite"
+
+storage_code = ['storage.py']
+clean_code = ['data_cleaner.py', 'incremental.py'] + storage_code
+feature_code = [
+    'create_features.py', 'feature_engine.py', 'membership_timeline.py', 'country_mentions.py', 'incremental.py',
+    'summary_stats.py',
+] + storage_code
+
+
+def table_files(data_dir, names):
+    return [path for name in names for path in (f"{data_dir}/{name}", f"{data_dir}/{name}.parquet")]
+
+
+class Stage:
+    # `function` in `module` is called in a worker with `args`, imports happen there so a
+    # run with nothing to do never loads pandas - `extra` goes into the cache key as is
+
+    def __init__(self, name, module, function, args=(), inputs=(), outputs=(), code=(), extra=None):
+        self.name = name
+        self.module = module
+        self.function = function
+        self.args = tuple(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.code = list(code)
+        self.extra = extra
+
+
+def feature_stages():
+    # members duration counts years up to today, so it goes stale when the year changes
+    year = time.strftime('%Y')
+    stages = [
+        Stage(
+            f"clean:{name}", 'data_cleaner', 'rebuild', (name,),
+            inputs=[f"{raw_dir}/{name}.csv"], outputs=table_files(clean_dir, [name]), code=clean_code,
+        )
+        for name in ['conflicts', 'resolutions', 'members']
+    ]
+    stages += [
+        Stage(
+            'features:conflicts', 'create_features', 'build_conflicts',
+            inputs=table_files(clean_dir, ['conflicts']),
+            outputs=table_files(feature_dir, ['conflicts', 'conflict_cube']), code=feature_code,
+        ),
+        Stage(
+            'features:members', 'create_features', 'build_members',
+            inputs=table_files(clean_dir, ['members']),
+            outputs=table_files(feature_dir, ['members']), code=feature_code, extra=year,
+        ),
+        Stage(
+            'features:resolutions', 'create_features', 'build_resolutions',
+            inputs=table_files(clean_dir, ['resolutions', 'members']),
+            outputs=table_files(feature_dir, [
+                'resolutions', 'resolution_parts', 'un_sessions', 'resolution_cube', 'resolution_swings',
+            ]),
+            code=feature_code,
+        ),
+        Stage(
+            'features:mentions', 'create_features', 'build_mentions',
+            inputs=table_files(clean_dir, ['resolutions', 'members', 'conflicts']),
+            outputs=table_files(feature_dir, ['resolution_mentions', 'conflict_countries']), code=feature_code,
+        ),
+        Stage(
+            'features:statistics', 'create_features', 'build_statistics',
+            inputs=table_files(feature_dir, ['conflicts', 'resolutions', 'un_sessions']),
+            outputs=[f"{feature_dir}/statistics.json"], code=feature_code,
+        ),
+    ]
+    return stages
+
+
+def stages_for(in_db=False):
+    stages = feature_stages()
+    if in_db:
+        # the clean csvs are streamed into the db and featured there, feature_data is not touched
+        return stages[:3] + [Stage(
+            'db:features', 'create_features_in_db', 'run', (True,),
+            inputs=[f"{clean_dir}/{name}" for name in ['conflicts', 'resolutions', 'members']],
+            outputs=[db_path], code=['create_features_in_db.py', 'insert_data_into_db.py'] + storage_code,
+            extra=time.strftime('%Y'),
+        )]
+    return stages + [Stage(
+        'db:load', 'insert_data_into_db', 'run',
+        inputs=table_files(feature_dir, [
+            'conflicts', 'resolutions', 'members', 'resolution_parts', 'un_sessions',
+            'resolution_mentions', 'conflict_countries', 'resolution_swings',
+        ]),
+        outputs=[db_path], code=['insert_data_into_db.py'] + storage_code,
+    )]
+
+
+def dependencies(stages):
+    # a stage depends on every stage that writes one of its inputs
+    writers = {path: stage.name for stage in stages for path in stage.outputs}
+    return {stage.name: {writers[path] for path in stage.inputs if path in writers} for stage in stages}
+
+
+class FileHashes:
+    # sha256 of files, remembered by (size, mtime) so unchanged files are not read again
+
+    def __init__(self, known):
+        self.known = known
+
+    def __call__(self, path):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        entry = self.known.get(path)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.known[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+
+def load_cache():
+    if not os.path.exists(CACHE_FILE):
+        return {'stages': {}, 'files': {}}
+    with open(CACHE_FILE) as f:
+        return json.load(f)
+
+
+def save_cache(cache):
+    tmp_path = f"{CACHE_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, CACHE_FILE)
+
+
+def stage_key(stage, file_hash):
+    key = {
+        'function': f"{stage.module}.{stage.function}{stage.args}",
+        'code': {path: file_hash(path) for path in stage.code},
+        'inputs': {path: file_hash(path) for path in stage.inputs},
+        'extra': stage.extra,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def is_cached(stage, key, entry, file_hash):
+    return (
+        entry is not None
+        and entry['key'] == key
+        and all(file_hash(path) == sha for path, sha in entry['outputs'].items())
+    )
+
+
+def run_stage(name, module, function, args):
+    started = time.perf_counter()
+    with span('stage', name):
+        result = getattr(importlib.import_module(module), function)(*args)
+    return result, time.perf_counter() - started
+
+
+def update_watermarks(stage, result):
+    # stages do full rebuilds, the incremental scripts pick up from what they consumed
+    from incremental import load_watermarks, save_watermarks, file_state
+
+    if stage.module == 'data_cleaner':
+        name = stage.args[0]
+        watermarks = load_watermarks(clean_dir)
+        watermarks[name] = {**file_state(stage.inputs[0]), 'rows': result}
+        save_watermarks(clean_dir, watermarks)
+
+
+def feature_readers(stages):
+    # the feature stages reading each clean csv
+    readers = {}
+    for stage in stages:
+        if stage.module == 'create_features':
+            for path in stage.inputs:
+                if path.startswith(f"{clean_dir}/") and not path.endswith('.parquet'):
+                    readers.setdefault(path, set()).add(stage.name)
+    return readers
+
+
+def update_feature_watermarks(stage, readers, done):
+    # a clean table is consumed once every feature stage reading it is done, run or cached - while
+    # one of them has failed the watermark stays put, so create_features.py --incremental still
+    # rebuilds what that stage did not
+    from incremental import load_watermarks, save_watermarks, file_state
+
+    consumed = [path for path in stage.inputs if stage.name in readers.get(path, ()) and readers[path] <= done]
+    if consumed:
+        watermarks = load_watermarks(feature_dir)
+        for path in consumed:
+            watermarks[os.path.basename(path)] = file_state(path)
+        save_watermarks(feature_dir, watermarks)
+
+
+def run(stages, workers=None, force=False):
+    cache = load_cache()
+    file_hash = FileHashes(cache['files'])
+    depends_on = dependencies(stages)
+    readers = feature_readers(stages)
+    waiting = {stage.name: stage for stage in stages}
+    done = set()
+    running = {}
+    failed = []
+
+    with ProcessPoolExecutor(workers) as pool:
+        while waiting or running:
+            # hand out every stage whose inputs are final, a cache hit frees its dependents at once
+            ready = [stage for name, stage in waiting.items() if depends_on[name] <= done]
+            for stage in ready:
+                del waiting[stage.name]
+                key = stage_key(stage, file_hash)
+                if not force and is_cached(stage, key, cache['stages'].get(stage.name), file_hash):
+                    print(f"{stage.name}: cached")
+                    done.add(stage.name)
+                    update_feature_watermarks(stage, readers, done)
+                    continue
+                print(f"{stage.name}: running")
+                running[pool.submit(run_stage, stage.name, stage.module, stage.function, stage.args)] = (stage, key)
+            if ready:
+                continue
+
+            # a failed stage blocks its dependents, stages already running still finish
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, key = running.pop(future)
+                try:
+                    result, seconds = future.result()
+                except Exception as exc:
+                    print(f"{stage.name}: failed - {exc!r}")
+                    cache['stages'].pop(stage.name, None)
+                    failed.append(stage.name)
+                    continue
+                update_watermarks(stage, result)
+                cache['stages'][stage.name] = {'key': key, 'outputs': {path: file_hash(path) for path in stage.outputs}}
+                print(f"{stage.name}: done in {seconds:.2f}s")
+                done.add(stage.name)
+                update_feature_watermarks(stage, readers, done)
+
+    save_cache(cache)
+    if failed or waiting:
+        raise RuntimeError(f"pipeline failed at {', '.join(failed)} - not run: {', '.join(waiting) or 'none'}")
+
+
+if __name__ == "__main__":
+    started = time.perf_counter()
+    workers = int(sys.argv[sys.argv.index('--workers') + 1]) if '--workers' in sys.argv else None
+    run(stages_for(in_db='--in-db' in sys.argv), workers=workers, force='--force' in sys.argv)
+    print(f"pipeline finished in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import resource
+import threading
+import functools
+import tracemalloc
+from collections import defaultdict
+
+# opt-in timing instrumentation - with QUANTIUM_PROFILE=<file> set, pipeline stages, feature
+# functions, table reads and writes, db loads, dashboard sections, view builds and sql
+# queries each append one json line to <file>: wall and cpu seconds, the peak of python and
+# numpy allocations (tracemalloc) above the start of the span, the process peak rss, rows in
+# and out and the span it ran inside. unset, `timed` hands back the undecorated function and
+# `span` a shared no-op, so the hot paths pay nothing - set, tracemalloc slows allocation
+# heavy code down a few times, compare wall times of profiled runs with each other only
+# QUANTIUM_PROFILE=profile.jsonl python pipeline.py --force
+# python profiling.py profile.jsonl   totals per span, slowest first
+
+PROFILE_FILE = os.environ.get('QUANTIUM_PROFILE')
+enabled = bool(PROFILE_FILE)
+
+MB = 1024 ** 2
+
+if enabled and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+local = threading.local()
+write_lock = threading.Lock()
+
+
+def n_rows(value):
+    # rows of a frame, series or array - summed over a dict, list or tuple of them
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        counts = [count for count in map(n_rows, value) if count is not None]
+        return sum(counts) if counts else None
+    shape = getattr(value, 'shape', None)
+    return int(shape[0]) if shape else None
+
+
+def emit(record):
+    line = json.dumps(record, default=str)
+    with write_lock, open(PROFILE_FILE, 'a') as f:
+        f.write(line + '\n')
+
+
+class Span:
+    # spans nest per thread, the allocation peak of a span includes the peaks of the spans
+    # inside it - tracemalloc is process wide, so spans running at the same time on other
+    # threads count towards it too
+
+    def __init__(self, kind, name, fields):
+        self.kind = kind
+        self.name = name
+        self.fields = fields
+        self.rows_in = None
+        self.rows_out = None
+
+    def __enter__(self):
+        stack = local.__dict__.setdefault('spans', [])
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self.parent is not None:
+            self.parent.peak = max(self.parent.peak, peak)
+        tracemalloc.reset_peak()
+        self.start_bytes = self.peak = current
+
+        self.started = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.thread_cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        thread_cpu = time.thread_time() - self.thread_cpu
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        local.spans.pop()
+        if self.parent is not None:
+            self.parent.peak = max(self.parent.peak, self.peak)
+
+        emit({
+            'ts': self.started,
+            'pid': os.getpid(),
+            'kind': self.kind,
+            'name': self.name,
+            'parent': None if self.parent is None else f"{self.parent.kind}:{self.parent.name}",
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'thread_cpu_s': round(thread_cpu, 6),
+            'peak_alloc_mb': round((self.peak - self.start_bytes) / MB, 3),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'error': None if exc_type is None else exc_type.__name__,
+            **self.fields,
+        })
+        return False
+
+
+class NullSpan:
+    # what `span` returns while profiling is off - rows set on it go nowhere
+    rows_in = None
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+null_span = NullSpan()
+
+
+def span(kind, name, **fields):
+    # with span('section', label, start_year=...) as s: ... s.rows_out = len(df)
+    if not enabled:
+        return null_span
+    return Span(kind, name, fields)
+
+
+def timed(kind, name=None):
+    # decorator - every call is a span, rows in from the frame arguments, out from the result
+    def decorate(function):
+        if not enabled:
+            return function
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(kind, label, {}) as s:
+                s.rows_in = n_rows(args)
+                result = function(*args, **kwargs)
+                s.rows_out = n_rows(result)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def summarize(path):
+    # calls, total and slowest wall seconds, total cpu and largest allocation peak per span
+    totals = defaultdict(lambda: {'calls': 0, 'wall_s': 0.0, 'max_wall_s': 0.0, 'cpu_s': 0.0, 'peak_alloc_mb': 0.0})
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            entry = totals[f"{record['kind']}:{record['name']}"]
+            entry['calls'] += 1
+            entry['wall_s'] += record['wall_s']
+            entry['max_wall_s'] = max(entry['max_wall_s'], record['wall_s'])
+            entry['cpu_s'] += record['cpu_s']
+            entry['peak_alloc_mb'] = max(entry['peak_alloc_mb'], record['peak_alloc_mb'])
+
+    print(f"{'span':<60} {'calls':>6} {'wall s':>9} {'max s':>9} {'cpu s':>9} {'peak MB':>9}")
+    for label, entry in sorted(totals.items(), key=lambda item: -item[1]['wall_s']):
+        print(
+            f"{label[:60]:<60} {entry['calls']:>6} {entry['wall_s']:>9.3f} {entry['max_wall_s']:>9.3f}"
+            f" {entry['cpu_s']:>9.3f} {entry['peak_alloc_mb']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    summarize(sys.argv[1] if len(sys.argv) > 1 else PROFILE_FILE)
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from feature_engine import CASUALTIES_OUTLIER
+from insert_data_into_db import db_path
+from table_cache import file_stamp
+from view_cache import ViewCache
+from profiling import span
+
+# read-only json api over quantium.sqlite (insert_data_into_db.py), so jobs can fetch the
+# features and case study numbers without running the pipeline - every endpoint takes
+# start_year / end_year (inclusive, default all years)
+#   GET /resolutions?passed=0|1&important=0|1&limit=1000&offset=0   resolutions voted in the range
+#   GET /sessions                                                  un sessions in the range
+#   GET /conflicts?outliers=1                                      conflicts started in the range
+#   GET /metrics                                                   the case study answers for the range
+#   GET /swings?topic=...&passed=0|1&limit=10                      most flippable resolutions in the range
+#   GET /health
+# requests are served on threads from a pool of read-only connections, responses are kept in
+# an LRU cache keyed by the request and the db file stamps, so a reloaded db is never served
+# from the cache
+# python query_service.py [--host 127.0.0.1] [--port 8000] [--pool 8] [--cache 1024]
+
+MAX_LIMIT = 10000
+# years are int16 columns, offsets a sqlite integer - larger values do not fit the bound parameters
+MIN_YEAR, MAX_YEAR = -32768, 32767
+MAX_OFFSET = 2 ** 63 - 1
+CIVIL_WAR_WORDS = ['GOVT', 'GVT', 'REBEL', 'CIVIL']
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class ConnectionPool:
+    # read-only connections, opened on demand up to `size` and then reused - a request waits
+    # for a free one when all are busy
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def open(self):
+        uri = f"file:{os.path.abspath(self.path)}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_open = self.opened < self.size
+                self.opened += can_open
+            if can_open:
+                try:
+                    conn = self.open()
+                except Exception:
+                    with self.lock:
+                        self.opened -= 1
+                    raise
+            else:
+                conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# request parameters
+
+def int_param(params, name, default=None, low=None, high=None):
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[-1])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer, got {values[-1]!r}")
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise BadRequest(f"{name} must be between {low} and {high}, got {value}")
+    return value
+
+
+def year_range(params):
+    return (
+        int_param(params, 'start_year', MIN_YEAR, MIN_YEAR, MAX_YEAR),
+        int_param(params, 'end_year', MAX_YEAR, MIN_YEAR, MAX_YEAR),
+    )
+
+
+def flag_param(params, name):
+    return int_param(params, name, low=0, high=1)
+
+
+def str_param(params, name):
+    values = params.get(name)
+    return values[-1] if values else None
+
+
+# endpoints - each returns the json document for its parameters
+
+def rows(conn, sql, args):
+    cursor = conn.execute(sql, args)
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+def resolutions(conn, params):
+    start_year, end_year = year_range(params)
+    args = {
+        'start_year': start_year, 'end_year': end_year,
+        'passed': flag_param(params, 'passed'), 'important': flag_param(params, 'important'),
+        'limit': int_param(params, 'limit', 1000, 0, MAX_LIMIT), 'offset': int_param(params, 'offset', 0, 0, MAX_OFFSET),
+    }
+    sql = """
+        select
+            resolution_id, session_id, year, date, unres, resolution_group_id, short_desc,
+            yes, no, abstain, important, vote_margin, percent_yes, resolution_passed
+        from resolutions
+        where year between :start_year and :end_year
+        and (:passed is null or resolution_passed = :passed)
+        and (:important is null or important = :important)
+        order by year, resolution_id
+        limit :limit offset :offset
+    """
+    return {'start_year': start_year, 'end_year': end_year, 'rows': rows(conn, sql, args)}
+
+
+def sessions(conn, params):
+    start_year, end_year = year_range(params)
+    args = {'start_year': start_year, 'end_year': end_year}
+    sql = "select * from un_sessions where year between :start_year and :end_year order by year, session_id"
+    return {'start_year': start_year, 'end_year': end_year, 'rows': rows(conn, sql, args)}
+
+
+def conflicts(conn, params):
+    # without the outliers of the dashboard unless outliers=1
+    start_year, end_year = year_range(params)
+    outliers = flag_param(params, 'outliers') or 0
+    args = {'start_year': start_year, 'end_year': end_year, 'outliers': outliers, 'outlier': CASUALTIES_OUTLIER}
+    sql = """
+        select conflict, start, "end", casualties, duration, intensity
+        from conflicts
+        where start between :start_year and :end_year
+        and (:outliers = 1 or casualties < :outlier)
+        order by start, conflict
+    """
+    return {'start_year': start_year, 'end_year': end_year, 'rows': rows(conn, sql, args)}
+
+
+def metrics(conn, params):
+    # the dashboard's case study answers for resolutions voted and conflicts started in the range
+    start_year, end_year = year_range(params)
+    args = {'start_year': start_year, 'end_year': end_year}
+    in_range = "year between :start_year and :end_year"
+
+    [totals] = rows(conn, f"""
+        select
+            count(*) as n_resolutions,
+            sum(resolution_passed) * 1.0 / count(*) as success_rate,
+            sum(resolution_passed * important) * 1.0 / nullif(sum(important), 0) as success_rate_important,
+            sum(resolution_passed * (1 - important)) * 1.0 / nullif(sum(1 - important), 0) as success_rate_not_important,
+            min(year) as first_year
+        from resolutions
+        where {in_range}
+    """, args)
+    decades = rows(conn, f"""
+        select year / 10 * 10 as decade, count(*) as n_resolutions
+        from resolutions where {in_range}
+        group by decade order by n_resolutions desc, decade limit 1
+    """, args)
+    [sessions_passed] = rows(conn, f"""
+        select count(*) as n_sessions, max(n_important) as most_important
+        from un_sessions where n_resolutions = n_passed and {in_range}
+    """, args)
+
+    civil_war = ' or '.join(f"upper(conflict) like '%{word}%'" for word in CIVIL_WAR_WORDS)
+    [conflict_totals] = rows(conn, f"""
+        select
+            count(*) as n_conflicts, max(casualties) as max_casualties,
+            sum({civil_war}) * 1.0 / nullif(count(*), 0) as civil_war_share
+        from conflicts where start between :start_year and :end_year
+    """, args)
+    # q2 - the 5% most intense of all conflicts, that started after the range's first resolution
+    [[n_all]] = conn.execute("select count(*) from conflicts").fetchall()
+    top_intensity = rows(conn, """
+        select conflict, start, casualties, intensity from conflicts
+        where start > :first_year order by intensity desc limit :k
+    """, {'first_year': totals['first_year'], 'k': int(n_all * 0.05)})
+    [members] = rows(conn, "select count(*) as n_members from members where year_joined <= :end_year", args)
+
+    return {
+        'start_year': start_year,
+        'end_year': end_year,
+        'n_resolutions': totals['n_resolutions'],
+        'success_rate': totals['success_rate'],
+        'success_rate_important': totals['success_rate_important'],
+        'success_rate_not_important': totals['success_rate_not_important'],
+        'top_decade': decades[0] if decades else None,
+        'sessions_all_passed': sessions_passed,
+        'n_conflicts': conflict_totals['n_conflicts'],
+        'max_casualties': conflict_totals['max_casualties'],
+        'civil_war_share': conflict_totals['civil_war_share'],
+        'top_5_p_intensity': top_intensity,
+        'n_members': members['n_members'],
+    }
+
+
+def swings(conn, params):
+    # resolutions by the fewest vote changes that flip them (resolution_swings) - the
+    # (swing_votes, year) and (short_desc, swing_votes) indexes return them in order
+    start_year, end_year = year_range(params)
+    args = {
+        'start_year': start_year, 'end_year': end_year, 'topic': str_param(params, 'topic'),
+        'passed': flag_param(params, 'passed'), 'limit': int_param(params, 'limit', 10, 0, MAX_LIMIT),
+    }
+    sql = """
+        select
+            resolution_id, year, short_desc, important, resolution_passed, yes, no, abstain, vote_margin, swing_votes
+        from resolution_swings
+        where year between :start_year and :end_year
+        and (:topic is null or short_desc = :topic)
+        and (:passed is null or resolution_passed = :passed)
+        order by swing_votes, year, resolution_id
+        limit :limit
+    """
+    return {'start_year': start_year, 'end_year': end_year, 'topic': args['topic'], 'rows': rows(conn, sql, args)}
+
+
+endpoints = {
+    '/resolutions': resolutions,
+    '/sessions': sessions,
+    '/conflicts': conflicts,
+    '/metrics': metrics,
+    '/swings': swings,
+}
+
+
+class QueryService:
+
+    def __init__(self, path=db_path, pool_size=8, cache_entries=1024):
+        self.path = path
+        self.pool = ConnectionPool(path, pool_size)
+        self.cache = ViewCache(max_entries=cache_entries)
+
+    def version(self):
+        # a reload rewrites the db (and its write-ahead log) - stamps of both key the cache
+        return file_stamp(self.path), file_stamp(f"{self.path}-wal")
+
+    def render(self, path, params):
+        with span('service', path, params=params), self.pool.connection() as conn:
+            document = endpoints[path](conn, dict(params))
+        return json.dumps(document).encode()
+
+    def respond(self, path, query):
+        # (status, json body) of a GET request
+        if path == '/health':
+            return 200, json.dumps({'ok': os.path.exists(self.path), 'db': self.path}).encode()
+        if path not in endpoints:
+            return 404, json.dumps({'error': f"unknown endpoint {path}", 'endpoints': sorted(endpoints)}).encode()
+        if not os.path.exists(self.path):
+            return 503, json.dumps({'error': f"{self.path} not found - run insert_data_into_db.py"}).encode()
+
+        # the same parameters in any order are the same request
+        params = tuple(sorted((name, tuple(values)) for name, values in parse_qs(query).items()))
+        try:
+            return 200, self.cache.get(path, self.version(), self.render, path, params)
+        except BadRequest as exc:
+            return 400, json.dumps({'error': str(exc)}).encode()
+        except sqlite3.Error as exc:
+            return 500, json.dumps({'error': f"{type(exc).__name__}: {exc}"}).encode()
+
+    def server(self, host='127.0.0.1', port=8000):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, so clients reuse their connection - headers and body go out as two
+            # writes, with nagle on the body waits for the client's delayed ack
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, body = service.respond(url.path, url.query)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        return server
+
+    def close(self):
+        self.pool.close()
+
+
+def option(name, default):
+    return sys.argv[sys.argv.index(name) + 1] if name in sys.argv else default
+
+
+if __name__ == "__main__":
+    service = QueryService(pool_size=int(option('--pool', 8)), cache_entries=int(option('--cache', 1024)))
+    server = service.server(option('--host', '127.0.0.1'), int(option('--port', 8000)))
+    print(f"serving {service.path} on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
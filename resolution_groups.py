@@ -0,0 +1,54 @@
+import numpy as np
+
+
+# multipart resolutions - "R/33/116A/I" .. "R/33/116B/VII" are the parts of group R/33/116
+# resolutions are kept sorted by group id and part so the parts of a group are one contiguous
+# slice found with binary searches, the per group rows of resolution_parts answer the session
+# and year span questions without touching the resolutions
+class ResolutionGroups:
+
+    def __init__(self, resolutions, parts):
+        # plain strings, the searches need them in the order they were sorted in
+        resolutions = resolutions.dropna(subset=['resolution_group_id'])
+        resolutions = resolutions.assign(resolution_group_id=resolutions['resolution_group_id'].astype(str))
+        resolutions = resolutions.sort_values(['resolution_group_id', 'unres_part', 'resolution_id'], kind='stable')
+        self.group_ids = resolutions['resolution_group_id'].to_numpy()
+        self.resolutions = resolutions.reset_index(drop=True)
+
+        self.groups = parts.dropna(subset=['unres_session']).reset_index(drop=True)
+        multipart = self.groups[self.groups['n_parts'] > 1]
+        self.sessions = (
+            multipart
+            .groupby(['unres_body', 'unres_session'], sort=True, observed=True)
+            .agg(first_year=('first_year', 'min'), n_groups=('n_parts', 'size'), n_parts=('n_parts', 'sum'))
+            .reset_index()
+        )
+
+    def __len__(self):
+        return len(self.groups)
+
+    def parts(self, group_id):
+        # every resolution of the group, in part order
+        first, last = np.searchsorted(self.group_ids, group_id, 'left'), np.searchsorted(self.group_ids, group_id, 'right')
+        return self.resolutions.iloc[first:last]
+
+    def part_counts_by_session(self, start_year=None, end_year=None, body='R'):
+        # multipart groups and their parts per session of `body`, sessions that began in the year range
+        sessions = self.sessions[self.sessions['unres_body'] == body]
+        if start_year is not None:
+            sessions = sessions[sessions['first_year'].between(start_year, end_year)]
+        return sessions.drop(columns='unres_body').reset_index(drop=True)
+
+    def multipart(self, start_year=None, end_year=None):
+        # groups of two or more parts with a part voted in the year range
+        groups = self.groups[self.groups['n_parts'] > 1]
+        if start_year is not None:
+            groups = groups[(groups['first_year'] <= end_year) & (groups['last_year'] >= start_year)]
+        return groups.reset_index(drop=True)
+
+    def spanning_years(self, start_year=None, end_year=None):
+        # groups whose parts were voted in more than one year, overlapping the year range
+        groups = self.multipart(start_year, end_year)
+        groups = groups[groups['last_year'] > groups['first_year']]
+        return groups.sort_values(['first_year', 'resolution_group_id']).reset_index(drop=True)
+
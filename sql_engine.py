@@ -0,0 +1,37 @@
+import sqlite3
+import threading
+import pandas as pd
+from profiling import span
+
+
+# persistent in-memory sqlite db over the dashboard frames - each frame is copied in
+# once and only copied again when a different frame is registered under its name,
+# queries take bound parameters (sqlite3 keeps the prepared statements) so the
+# year filters never rebuild a table
+# same sqlite dialect as pandasql, so existing queries run unchanged
+
+class SqlEngine:
+
+    def __init__(self):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.lock = threading.Lock()
+        self.frames = {}
+
+    def register(self, name, df):
+        with self.lock:
+            if self.frames.get(name) is df:
+                return
+            with span('sql_register', name) as s:
+                s.rows_in = len(df)
+                df.to_sql(name, self.conn, if_exists='replace', index=False)
+            # keep a reference so the identity check above stays valid
+            self.frames[name] = df
+
+    def query(self, q, params=None):
+        with self.lock, span('query', ' '.join(q.split()), params=params) as s:
+            df = pd.read_sql_query(q, self.conn, params=params)
+            s.rows_out = len(df)
+        return df
+
+
+sql_engine = SqlEngine()
@@ -0,0 +1,338 @@
+import os
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from profiling import span
+
+
+# typed columnar storage for clean_data and feature_data
+# every table is written as the usual extension-less csv plus a <name>.parquet copy
+# with an explicit schema - native dates, small ints and dictionary encoded text,
+# row groups of whole years so year filters skip whole row groups
+
+CLEAN_DIR = "data/clean_data"
+FEATURE_DIR = "data/feature_data"
+
+category = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMAS = {
+    'conflicts': pa.schema([
+        ('conflict', pa.string()),
+        ('start', pa.int16()),
+        ('end', pa.int16()),
+        ('casualties', pa.int32()),
+        ('duration', pa.int16()),
+        ('intensity', pa.int32()),
+    ]),
+    'resolutions': pa.schema([
+        ('session_id', pa.int16()),
+        ('resolution_id', pa.int32()),
+        ('abstain', pa.int16()),
+        ('yes', pa.int16()),
+        ('no', pa.int16()),
+        ('important', pa.int8()),
+        ('date', pa.date32()),
+        ('unres', pa.string()),
+        ('amend', pa.float32()),
+        ('para', pa.float32()),
+        ('short_desc', category),
+        ('length', pa.string()),
+        ('long_desc', pa.string()),
+        ('vote_margin', pa.int16()),
+        ('n_members', pa.int32()),
+        ('total_votes', pa.int16()),
+        ('percent_abstain', pa.float64()),
+        ('percent_yes', pa.float64()),
+        ('percent_no', pa.float64()),
+        ('resolution_passed', pa.int8()),
+        ('resolution_group_id', pa.string()),
+        ('unres_body', category),
+        ('unres_session', pa.int16()),
+        ('unres_number', pa.int32()),
+        ('unres_part', pa.string()),
+        ('year', pa.int16()),
+    ]),
+    'members': pa.schema([
+        ('country', category),
+        ('joined_on', pa.date32()),
+        ('duration', pa.int16()),
+        ('year_joined', pa.int16()),
+    ]),
+    'resolution_parts': pa.schema([
+        ('resolution_group_id', pa.string()),
+        ('n_parts', pa.int16()),
+        ('unres_body', category),
+        ('unres_session', pa.int16()),
+        ('first_year', pa.int16()),
+        ('last_year', pa.int16()),
+    ]),
+    'un_sessions': pa.schema([
+        ('year', pa.int16()),
+        ('n_resolutions', pa.int32()),
+        ('n_passed', pa.int32()),
+        ('n_members', pa.int32()),
+        ('percent_passed', pa.float64()),
+        ('n_important', pa.int32()),
+        ('session_id', pa.int16()),
+    ]),
+    'resolution_cube': pa.schema([
+        ('year', pa.int16()),
+        ('resolution_passed', pa.int8()),
+        ('important', pa.int8()),
+        ('n_resolutions', pa.int32()),
+        ('sum_vote_margin', pa.int64()),
+        ('sum_n_members', pa.int64()),
+        ('cum_n_resolutions', pa.int32()),
+        ('cum_sum_vote_margin', pa.int64()),
+        ('cum_sum_n_members', pa.int64()),
+    ]),
+    'conflict_cube': pa.schema([
+        ('start', pa.int16()),
+        ('end', pa.int16()),
+        ('duration', pa.int16()),
+        ('outlier', pa.int8()),
+        ('n_conflicts', pa.int32()),
+        ('sum_casualties', pa.int64()),
+        ('sum_intensity', pa.int64()),
+        ('cum_n_conflicts', pa.int32()),
+        ('cum_sum_casualties', pa.int64()),
+        ('cum_sum_intensity', pa.int64()),
+    ]),
+    'resolution_mentions': pa.schema([
+        ('entity', category),
+        ('kind', category),
+        ('resolution_id', pa.int32()),
+        ('year', pa.int16()),
+    ]),
+    'conflict_countries': pa.schema([
+        ('conflict', pa.string()),
+        ('start', pa.int16()),
+        ('end', pa.int16()),
+        ('country', category),
+    ]),
+    'resolution_swings': pa.schema([
+        ('resolution_id', pa.int32()),
+        ('year', pa.int16()),
+        ('short_desc', category),
+        ('important', pa.int8()),
+        ('resolution_passed', pa.int8()),
+        ('yes', pa.int16()),
+        ('no', pa.int16()),
+        ('abstain', pa.int16()),
+        ('vote_margin', pa.int16()),
+        ('swing_votes', pa.int16()),
+    ]),
+}
+
+# a row group takes whole years until it has at least this many rows - smaller groups cost
+# more in metadata and per group reads than a year filter saves by skipping them
+MIN_ROW_GROUP_ROWS = 4096
+
+# column used for row group pruning
+YEAR_COLUMNS = {
+    'conflicts': 'start',
+    'resolutions': 'year',
+    'members': 'year_joined',
+    'un_sessions': 'year',
+    'resolution_cube': 'year',
+    'conflict_cube': 'start',
+    'resolution_mentions': 'year',
+    'conflict_countries': 'start',
+    'resolution_swings': 'year',
+}
+
+# date formats of the csv copies
+CSV_DATE_FORMATS = {
+    CLEAN_DIR: {'joined_on': "%m/%d/%Y", 'date': "%d/%m/%Y"},
+    FEATURE_DIR: {'joined_on': "%Y-%m-%d", 'date': "%Y-%m-%d"},
+}
+
+
+def table_schema(df, name):
+    # declared types for known columns, inferred types for anything else
+    declared = SCHEMAS.get(name, pa.schema([]))
+    return pa.schema([
+        declared.field(col) if col in declared.names
+        else pa.Schema.from_pandas(df[[col]], preserve_index=False).field(col)
+        for col in df.columns
+    ])
+
+
+def compact_dtypes(df, name):
+    # declared small int / float types and categoricals for a frame, text and dates are left alone
+    dtypes = {}
+    for field in SCHEMAS.get(name, []):
+        if field.name not in df.columns:
+            continue
+        if pa.types.is_dictionary(field.type):
+            dtypes[field.name] = 'category'
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            dtypes[field.name] = field.type.to_pandas_dtype()
+    return df.astype(dtypes)
+
+
+def nullable_dtype(arrow_type):
+    # pandas nullable integer dtype of an arrow integer type, Int16 for int16
+    return pd.array(np.empty(0, arrow_type.to_pandas_dtype())).dtype
+
+
+def to_arrow(df, data_dir, name):
+    df = df.copy()
+    schema = table_schema(df, name)
+    for field in schema:
+        col = field.name
+        if pa.types.is_date(field.type) and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=CSV_DATE_FORMATS[data_dir][col])
+        elif pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            if df[col].dtype == object:
+                df[col] = pd.to_numeric(df[col])
+            # a csv read gives integers with missing values as floats - nullable integers, like
+            # the features are built with, so csv and parquet reads get the same dtype
+            if pa.types.is_integer(field.type) and pd.api.types.is_float_dtype(df[col]):
+                df[col] = df[col].astype(nullable_dtype(field.type))
+        elif pa.types.is_string(field.type) and not pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].map(str, na_action='ignore')
+    return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+
+def from_arrow(table):
+    return table.to_pandas(date_as_object=False)
+
+
+def apply_schema(df, data_dir, name):
+    # typed frame from a csv read, same dtypes as a parquet read
+    return from_arrow(to_arrow(df, data_dir, name))
+
+
+def compact_dictionaries(table):
+    # slices keep the whole dictionary and parquet would store all of it in every row group,
+    # so dictionary columns are re-encoded with only the values the slice uses
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            column = pc.dictionary_encode(table.column(i).cast(field.type.value_type)).cast(field.type)
+            table = table.set_column(i, field, column)
+    return table
+
+
+def year_row_groups(table, year_col, min_rows=MIN_ROW_GROUP_ROWS):
+    # slices of consecutive whole years with at least min_rows rows (but the last), rows keep
+    # their order within a year
+    if year_col not in table.column_names:
+        yield compact_dictionaries(table)
+        return
+
+    years = table.column(year_col).to_numpy()
+    order = pd.Series(years).sort_values(kind='stable').index.to_numpy()
+    table = table.take(order)
+    years = years[order]
+    year_starts = [i for i in range(1, len(years)) if years[i] != years[i - 1]]
+    boundaries = [0]
+    for i in year_starts:
+        if i - boundaries[-1] >= min_rows:
+            boundaries.append(i)
+    boundaries.append(len(years))
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        yield compact_dictionaries(table.slice(start, end - start))
+
+
+def write_parquet(table, data_dir, name):
+    path = f"{data_dir}/{name}.parquet"
+    with pq.ParquetWriter(path, table.schema) as writer:
+        for group in year_row_groups(table, YEAR_COLUMNS.get(name)):
+            writer.write_table(group)
+
+
+def write_table(df, data_dir, name):
+    with span('write', name, data_dir=data_dir) as s:
+        s.rows_in = len(df)
+        df.to_csv(f"{data_dir}/{name}", index=False)
+        write_parquet(to_arrow(df, data_dir, name), data_dir, name)
+
+
+def append_table(new_rows, data_dir, name):
+    # append to the csv, the parquet copy is rewritten with the new rows added
+    with span('append', name, data_dir=data_dir) as s:
+        s.rows_in = len(new_rows)
+        new_rows.to_csv(f"{data_dir}/{name}", mode='a', header=False, index=False)
+        path = f"{data_dir}/{name}.parquet"
+        new_table = to_arrow(new_rows, data_dir, name)
+        if os.path.exists(path):
+            new_table = pa.concat_tables([pq.read_table(path).cast(new_table.schema), new_table])
+        write_parquet(new_table, data_dir, name)
+        s.rows_out = new_table.num_rows
+
+
+class TableWriter:
+    # writes a table chunk by chunk with only one chunk in memory - csv rows are appended as
+    # they come and each chunk goes into the parquet copy as row groups of whole years
+    # with append=True the existing parquet row groups are streamed into the new copy first
+
+    def __init__(self, data_dir, name, append=False):
+        self.data_dir = data_dir
+        self.name = name
+        self.append = append
+        self.csv_path = f"{data_dir}/{name}"
+        self.path = f"{data_dir}/{name}.parquet"
+        self.tmp_path = f"{self.path}.tmp"
+        self.writer = None
+        self.n_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def write(self, df):
+        # declared float columns always go out as floats, whatever a chunk was inferred as
+        floats = [field.name for field in SCHEMAS.get(self.name, []) if pa.types.is_floating(field.type)]
+        df = df.astype({col: 'float64' for col in floats if col in df.columns})
+        header = self.writer is None and not self.append
+        df.to_csv(self.csv_path, mode='w' if header else 'a', header=header, index=False)
+
+        table = to_arrow(df, self.data_dir, self.name)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, table.schema)
+            if self.append and os.path.exists(self.path):
+                existing = pq.ParquetFile(self.path)
+                for i in range(existing.num_row_groups):
+                    self.writer.write_table(existing.read_row_group(i).cast(table.schema))
+
+        for group in year_row_groups(table.cast(self.writer.schema), YEAR_COLUMNS.get(self.name)):
+            self.writer.write_table(group)
+        self.n_rows += len(df)
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.writer is None:
+            return
+        self.writer.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+
+def read_table(data_dir, name, columns=None, years=None):
+    # typed table, reading only `columns` and rows with year in the inclusive `years` range
+    with span('read', name, data_dir=data_dir, columns=columns, years=years) as s:
+        df = read_typed(data_dir, name, columns, years)
+        s.rows_out = len(df)
+    return df
+
+
+def read_typed(data_dir, name, columns, years):
+    year_col = YEAR_COLUMNS.get(name)
+    path = f"{data_dir}/{name}.parquet"
+
+    # the parquet copy is only used while it is at least as new as the csv
+    csv_path = f"{data_dir}/{name}"
+    if os.path.exists(path) and (not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path)):
+        filters = None
+        if years is not None and year_col in pq.read_schema(path).names:
+            filters = [(year_col, '>=', years[0]), (year_col, '<=', years[1])]
+        return from_arrow(pq.read_table(path, columns=columns, filters=filters))
+
+    # no (fresh) parquet copy - fall back to the csv
+    df = apply_schema(pd.read_csv(csv_path), data_dir, name)
+    if years is not None and year_col in df.columns:
+        df = df[(df[year_col] >= years[0]) & (df[year_col] <= years[1])].reset_index(drop=True)
+    return df if columns is None else df[columns]
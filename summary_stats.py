@@ -0,0 +1,198 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from feature_engine import CASUALTIES_OUTLIER
+from storage import YEAR_COLUMNS
+from profiling import timed
+
+# precomputed statistics artifact - correlation matrices, histogram bins, quantiles and top-k
+# tables of the feature tables for their full year range, the dashboard's default range and
+# every YEAR_BUCKET years. create_features.py writes it next to the feature tables with the sha256 of the files it
+# was computed from, a stale artifact is ignored. the dashboard computes the same statistics
+# with the same functions from the rows for any range the artifact does not cover
+
+STATISTICS_FILE = 'statistics.json'
+FORMAT_VERSION = 1
+YEAR_BUCKET = 10
+# the range of the dashboard's year sliders, its default view
+YEAR_RANGE = (1899, 2011)
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+TOP_K = 10
+MAX_BINS = 200
+
+source_tables = ['conflicts', 'resolutions', 'un_sessions']
+
+
+# statistics of the rows of one year range
+
+def histogram_bins(values, max_bins=MAX_BINS):
+    # start / end / count per bin - integers get unit bins centred on the values while they
+    # fit in max_bins and wider integer bins after that, other values numpy's 'auto' edges
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return pd.DataFrame({'start': [], 'end': [], 'count': []})
+
+    low, high = values.min(), values.max()
+    if np.all(values == np.round(values)):
+        width = int(np.ceil((high - low + 1) / max_bins))
+        n_bins = int((high - low) // width) + 1
+        counts = np.bincount(((values - low) // width).astype(np.int64), minlength=n_bins)
+        edges = low - 0.5 + width * np.arange(n_bins + 1)
+    else:
+        edges = np.histogram_bin_edges(values, 'auto')
+        if len(edges) - 1 > max_bins:
+            edges = np.linspace(low, high, max_bins + 1)
+        counts, edges = np.histogram(values, edges)
+
+    return pd.DataFrame({'start': edges[:-1], 'end': edges[1:], 'count': counts})
+
+
+def correlation(df):
+    return df.corr(numeric_only=True)
+
+
+def quantiles(df, cols):
+    return df[cols].quantile(QUANTILES).rename_axis('quantile')
+
+
+def top_k(df, col, columns, ascending=False, k=TOP_K):
+    # ties go to the earlier rows
+    ranked = df.nsmallest(k, col) if ascending else df.nlargest(k, col)
+    return ranked[columns].reset_index(drop=True)
+
+
+def conflict_statistics(conflicts):
+    # conflicts without outliers that started in the range
+    stats = {
+        'corr': correlation(conflicts),
+        'quantiles': quantiles(conflicts, ['casualties', 'intensity', 'duration']),
+    }
+    for measure in ['intensity', 'casualties', 'duration']:
+        stats[f'top_{measure}'] = top_k(conflicts, measure, ['conflict', measure])
+    return stats
+
+
+def resolution_statistics(resolutions, conflicts):
+    # resolutions voted in the range, `conflicts` are all of them - q2 ranks the 5% most intense
+    # conflicts that started after the first resolution of the range
+    passed = resolutions['resolution_passed'] == 1
+    stats = {
+        'corr': correlation(resolutions),
+        'quantiles': quantiles(resolutions, ['vote_margin', 'percent_yes']),
+    }
+    for label, rows in [('all', resolutions), ('passed', resolutions[passed]), ('not_passed', resolutions[~passed])]:
+        stats[f'vote_margin_bins_{label}'] = histogram_bins(rows['vote_margin'])
+    for label, rows in [('passed', resolutions[passed]), ('not_passed', resolutions[~passed])]:
+        columns = ['vote_margin', 'short_desc', 'long_desc']
+        stats[f'highest_vote_margins_{label}'] = top_k(rows, 'vote_margin', columns)
+        stats[f'lowest_vote_margins_{label}'] = top_k(rows, 'vote_margin', columns, ascending=True)
+
+    later = conflicts[conflicts['start'] > resolutions['year'].min()]
+    stats['top_5_p_intensity'] = top_k(later, 'intensity', ['conflict', 'casualties'], k=int(conflicts['conflict'].count() * 0.05))
+    return stats
+
+
+def session_statistics(un_sessions):
+    return {'corr': correlation(un_sessions)}
+
+
+# the artifact
+
+def rows_range(years, start_year, end_year):
+    # first and last of the table's (sorted, distinct) years in the range - ranges over the
+    # same rows have the same key, None when the range has no rows
+    first, last = np.searchsorted(years, start_year, 'left'), np.searchsorted(years, end_year, 'right')
+    if first == last:
+        return None
+    return f"{years[first]}-{years[last - 1]}"
+
+
+def year_scopes(years, bucket=YEAR_BUCKET):
+    # the full range, the dashboard's default range and every bucket
+    first, last = int(years[0]), int(years[-1])
+    buckets = [(start, start + bucket - 1) for start in range(first // bucket * bucket, last + 1, bucket)]
+    return [(first, last), YEAR_RANGE] + buckets
+
+
+def encode(df):
+    return df.to_dict(orient='split')
+
+
+def decode(value):
+    return pd.DataFrame(value['data'], index=value['index'], columns=value['columns'])
+
+
+@timed('feature')
+def summary_statistics(conflicts, resolutions, un_sessions, bucket=YEAR_BUCKET):
+    # {table: {'years': [distinct years], 'scopes': {"first-last": {name: frame}}}}
+    scoped = {
+        'conflicts': (conflicts[conflicts['casualties'] < CASUALTIES_OUTLIER], conflict_statistics),
+        'resolutions': (resolutions, lambda rows: resolution_statistics(rows, conflicts)),
+        'un_sessions': (un_sessions, session_statistics),
+    }
+    tables = {}
+    for name, (df, statistics) in scoped.items():
+        years = df[YEAR_COLUMNS[name]]
+        distinct = np.unique(years.dropna().to_numpy()).astype(int)
+        scopes = {}
+        for start, end in year_scopes(distinct, bucket):
+            key = rows_range(distinct, start, end)
+            if key is not None and key not in scopes:
+                scopes[key] = {stat: encode(frame) for stat, frame in statistics(df[years.between(start, end)]).items()}
+        tables[name] = {'years': distinct.tolist(), 'scopes': scopes}
+    return tables
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_statistics(tables, data_dir, bucket=YEAR_BUCKET):
+    # written after the feature tables, it records the csvs it was computed from
+    artifact = {
+        'format': FORMAT_VERSION,
+        'year_bucket': bucket,
+        'sources': {name: file_sha256(f"{data_dir}/{name}") for name in source_tables},
+        'tables': tables,
+    }
+    tmp_path = f"{data_dir}/{STATISTICS_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, f"{data_dir}/{STATISTICS_FILE}")
+
+
+class Statistics:
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.years = {name: np.array(entry['years']) for name, entry in tables.items()}
+
+    def scope(self, table, start_year, end_year):
+        # every statistic of the table for the range, None when the artifact has no scope over
+        # the same rows
+        scope = self.tables[table]['scopes'].get(rows_range(self.years[table], start_year, end_year))
+        if scope is None:
+            return None
+        return {name: decode(value) for name, value in scope.items()}
+
+
+def read_statistics(data_dir):
+    # None when there is no artifact, or it is of another format or other data
+    path = f"{data_dir}/{STATISTICS_FILE}"
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        artifact = json.load(f)
+    if artifact.get('format') != FORMAT_VERSION:
+        return None
+    for name, sha256 in artifact['sources'].items():
+        if not os.path.exists(f"{data_dir}/{name}") or file_sha256(f"{data_dir}/{name}") != sha256:
+            return None
+    return Statistics(artifact['tables'])
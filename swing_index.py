@@ -0,0 +1,52 @@
+import numpy as np
+
+
+# resolutions by how few members changing their vote would flip them (resolution_swings) -
+# kept sorted by swing votes and year, once over all topics and once within every topic, so
+# the most flippable resolutions of a year range are the first rows of the sorted slice that
+# fall in the range. a topic is the resolution's short description
+class SwingIndex:
+
+    def __init__(self, swings):
+        # plain strings, the topic searches need them in the order they were sorted in
+        swings = swings.dropna(subset=['short_desc'])
+        swings = swings.assign(topic=swings['short_desc'].astype(str))
+        self.swings = swings.sort_values(['swing_votes', 'year', 'resolution_id'], kind='stable').reset_index(drop=True)
+        by_topic = self.swings.sort_values('topic', kind='stable')
+        self.topics = by_topic['topic'].to_numpy()
+        self.by_topic = by_topic.reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.swings)
+
+    def rows(self, topic=None):
+        # every resolution, or those of the topic, most flippable first
+        if topic is None:
+            return self.swings
+        first, last = np.searchsorted(self.topics, topic, 'left'), np.searchsorted(self.topics, topic, 'right')
+        return self.by_topic.iloc[first:last]
+
+    def in_range(self, rows, start_year, end_year, passed=None):
+        mask = rows['year'].between(start_year, end_year).to_numpy()
+        if passed is not None:
+            mask = mask & (rows['resolution_passed'].to_numpy() == passed)
+        return rows[mask]
+
+    def most_flippable(self, start_year, end_year, topic=None, passed=None, k=10):
+        # the k resolutions voted in the range that the fewest vote changes flip - only passed
+        # (1) or failed (0) resolutions with `passed`, ties go to the earlier votes
+        return self.in_range(self.rows(topic), start_year, end_year, passed).head(k).drop(columns='topic').reset_index(drop=True)
+
+    def topic_swings(self, start_year, end_year, passed=None, close=5):
+        # per topic, its resolutions in the range, the fewest vote changes that flip one of them,
+        # the median and how many flip with at most `close` changes - most flippable topics first
+        rows = self.in_range(self.swings, start_year, end_year, passed)
+        grouped = rows.groupby('topic', sort=True)['swing_votes']
+        topics = grouped.agg(n_resolutions='size', min_swing_votes='min', median_swing_votes='median')
+        topics[f'n_within_{close}_votes'] = (rows['swing_votes'] <= close).groupby(rows['topic'], sort=True).sum()
+        return (
+            topics
+            .sort_values(['min_swing_votes', 'n_resolutions'], ascending=[True, False], kind='stable')
+            .rename_axis('topic')
+            .reset_index()
+        )
@@ -0,0 +1,87 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# synthetic raw_data at `scale` times the size of the bundled csvs, for benchmarks
+# replica 0 is the real data, every further replica is a perturbed copy of it with its own
+# keys - resolution ids and symbol numbers are shifted, country and conflict names get the
+# replica number - so the years, sessions, vote shares and text keep the real distributions
+# replicas are written one at a time, memory stays at the size of one copy of the source
+# python synthetic_data.py <scale> <output raw_data dir> [--seed N]
+
+raw_dir = "data/raw_data"
+names = ['conflicts', 'resolutions', 'members']
+
+
+def jitter(values, rng, spread):
+    # small integer noise, counts never go negative
+    return (values + rng.integers(-spread, spread + 1, len(values))).clip(lower=0)
+
+
+def with_replica(names, replica):
+    # "<name> [note]" -> "<name> <replica> [note]", the cleaner cuts everything from the note on
+    parts = names.str.extract(r'^([^\[(]*)(.*)$')
+    return (parts[0].str.rstrip() + f" {replica} " + parts[1]).str.rstrip()
+
+
+def conflicts_replica(conflicts, replica, rng):
+    conflicts = conflicts.copy()
+    conflicts['Conflict'] = with_replica(conflicts['Conflict'], replica)
+    casualties = conflicts['Casualties'].astype('int64')
+    conflicts['Casualties'] = (casualties * rng.uniform(0.8, 1.2, len(casualties))).round().astype('int64')
+    return conflicts
+
+
+def members_replica(members, replica, rng):
+    members = members.copy()
+    members['Country'] = with_replica(members['Country'], replica)
+    return members
+
+
+def resolutions_replica(resolutions, replica, rng):
+    resolutions = resolutions.copy()
+    rcid = resolutions['RCID'].astype('int64')
+    resolutions['RCID'] = rcid + replica * (rcid.max() + 1)
+
+    # R/<session>/<number>... -> the number moves to its own range, parts stay grouped
+    symbol = resolutions['UNRES'].str.extract(r'^([^/]*/[^/]*/)(\d+)(.*)$')
+    numbered = symbol[1].notna()
+    shifted = symbol[0] + (symbol[1].astype('float').astype('Int64') + replica * 100000).astype(str) + symbol[2]
+    resolutions['UNRES'] = shifted.where(numbered, resolutions['UNRES'])
+
+    # votes move by a few, a roll call with no votes left keeps its real ones
+    votes = resolutions[['YES', 'NO', 'ABSTAIN']].astype('int64')
+    noisy = votes.apply(lambda col: jitter(col, rng, 2))
+    empty = noisy.sum(axis=1) == 0
+    resolutions[['YES', 'NO', 'ABSTAIN']] = noisy.mask(empty, votes)
+    return resolutions
+
+
+replicas = {
+    'conflicts': conflicts_replica,
+    'resolutions': resolutions_replica,
+    'members': members_replica,
+}
+
+
+def generate(output_dir, scale, seed=0, source_dir=raw_dir):
+    # writes <output_dir>/<name>.csv for every raw table, returns their row counts
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_rows = {}
+    for name in names:
+        # text as read, so replica 0 is written back with the values of the real file
+        source = pd.read_csv(f"{source_dir}/{name}.csv", dtype=str, keep_default_na=False)
+        path = f"{output_dir}/{name}.csv"
+        for replica in range(scale):
+            rows = source if replica == 0 else replicas[name](source, replica, rng)
+            rows.to_csv(path, mode='w' if replica == 0 else 'a', header=replica == 0, index=False)
+        n_rows[name] = len(source) * scale
+    return n_rows
+
+
+if __name__ == "__main__":
+    seed = int(sys.argv[sys.argv.index('--seed') + 1]) if '--seed' in sys.argv else 0
+    for name, count in generate(sys.argv[2], int(sys.argv[1]), seed=seed).items():
+        print(f"{name}: {count} rows")
@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from storage import YEAR_COLUMNS, read_table
+
+
+# process wide cache of typed tables, shared by every rerun and session of the dashboard
+# entries are keyed on the read arguments and invalidated when the csv or parquet file
+# behind them changes (mtime or size), the least recently used entries are dropped
+# once the cache holds more than max_entries tables or max_bytes of data
+# prefetched tables are read on the loader threads, parquet reads release the gil so
+# independent tables load side by side while the caller goes on with what it has
+
+loader = ThreadPoolExecutor(max_workers=8, thread_name_prefix='table-loader')
+
+def file_stamp(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def table_stamp(data_dir, name):
+    return file_stamp(f"{data_dir}/{name}"), file_stamp(f"{data_dir}/{name}.parquet")
+
+
+def table_key(data_dir, name, columns=None, years=None):
+    return data_dir, name, None if columns is None else tuple(columns), None if years is None else tuple(years)
+
+
+class TableCache:
+
+    def __init__(self, max_entries=32, max_bytes=512 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def read(self, data_dir, name, columns=None, years=None):
+        # cached frames are shared - callers filter or copy them, never modify in place
+        key = table_key(data_dir, name, columns, years)
+        stamp = table_stamp(data_dir, name)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        df = read_table(data_dir, name, columns=columns, years=years)
+        # kept sorted by year, so a year range of a cached table is a slice of it
+        year_col = YEAR_COLUMNS.get(name)
+        if year_col in df.columns and not df[year_col].is_monotonic_increasing:
+            df = df.sort_values(year_col, kind='stable', ignore_index=True)
+        size = int(df.memory_usage(deep=True).sum())
+
+        with self.lock:
+            self.evict(key)
+            self.entries[key] = (stamp, df, size)
+            self.n_bytes += size
+            while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.n_bytes > self.max_bytes):
+                self.evict(next(iter(self.entries)))
+
+        return df
+
+    def prefetch(self, data_dir, name, columns=None, years=None):
+        # future of the table, read on the loader threads - a read of it still running is shared
+        key = table_key(data_dir, name, columns, years)
+        with self.lock:
+            future = self.loading.get(key)
+            if future is not None:
+                return future
+            future = self.loading[key] = loader.submit(self.read, data_dir, name, columns, years)
+        future.add_done_callback(lambda done: self.loading.pop(key, None))
+        return future
+
+    def evict(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.n_bytes -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.n_bytes = 0
+
+
+table_cache = TableCache()
+
+
+def load_table(data_dir, name, columns=None, years=None):
+    return table_cache.read(data_dir, name, columns=columns, years=years)
+
+
+def prefetch_table(data_dir, name, columns=None, years=None):
+    return table_cache.prefetch(data_dir, name, columns=columns, years=years)
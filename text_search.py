@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+from insert_data_into_db import db_path
+
+
+# ranked full text search over resolution short_desc / long_desc, answered from the
+# resolutions_fts index insert_data_into_db.py builds in quantium.sqlite
+# queries take the fts5 syntax - words, "exact phrases", prefix* and AND / OR / NOT -
+# input that does not parse is searched again as plain words
+
+search_sql = """
+    select
+        r.resolution_id, r.year, r.date, r.unres, r.short_desc,
+        snippet(resolutions_fts, 1, '[', ']', '...', 16) as match,
+        r.yes, r.no, r.abstain, r.vote_margin, r.percent_yes, r.resolution_passed, r.important,
+        -bm25(resolutions_fts, 2.0, 1.0) as score
+    from resolutions_fts
+    join resolutions r on r.resolution_id = resolutions_fts.rowid
+    where resolutions_fts match :query and r.year between :start_year and :end_year
+    order by bm25(resolutions_fts, 2.0, 1.0)
+    limit :limit
+"""
+
+
+def plain_words(text):
+    # every word as a quoted phrase, so fts operators and stray quotes lose their meaning
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class SearchIndex:
+    # one read-only connection for the whole process, opened on first use so the
+    # dashboard starts without a db - sqlite reads see a reloaded db on the next query
+
+    def __init__(self, path=db_path):
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def connection(self):
+        if self.conn is None:
+            uri = f"file:{os.path.abspath(self.path)}?mode=ro"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        return self.conn
+
+    def available(self):
+        if not os.path.exists(self.path):
+            return False
+        with self.lock:
+            found = self.connection().execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'resolutions_fts'"
+            ).fetchone()
+        return found is not None
+
+    def search(self, text, start_year, end_year, limit=100):
+        params = {'query': text, 'start_year': start_year, 'end_year': end_year, 'limit': limit}
+        with self.lock:
+            try:
+                return pd.read_sql_query(search_sql, self.connection(), params=params)
+            except pd.errors.DatabaseError:
+                params['query'] = plain_words(text)
+                return pd.read_sql_query(search_sql, self.connection(), params=params)
+
+
+# shared by every rerun and session of the dashboard
+search_index = SearchIndex()
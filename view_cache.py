@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+from profiling import span
+
+
+# process wide cache of what the dashboard builds for a view, shared by every rerun and
+# session - a section's frames and figures are kept per builder, arguments (the year range)
+# and version of the data behind them, so moving the sliders back to a range or opening a
+# section again costs nothing. the least recently used entries are dropped past max_entries
+
+class ViewCache:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name, version, build, *args):
+        # cached values are shared - callers render them, never modify them in place
+        key = (name, version, args)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        with span('view', name, args=args):
+            value = build(*args)
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+view_cache = ViewCache()
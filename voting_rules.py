@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+from feature_engine import PASS_SHARE, round_like_python
+
+
+# what-if voting rules - a rule is the share of yes votes a resolution needs to pass, one
+# for important and one for other resolutions, and what the share is of:
+#   counted   yes / (yes + no + abstain), how resolution_passed is computed
+#   ignored   yes / (yes + no), abstentions are not votes ("present and voting")
+#   members   yes / members at the time of the vote, absent members count against
+# the shares are computed once per simulator - `outcomes` compares a whole grid of rules with
+# them in one pass, a resolutions x rules matrix, and `pass_rates` counts the resolutions of
+# every session or year each rule passes from the shares sorted per group, so sweeping
+# thousands of rules takes milliseconds
+# sim = VoteSimulator(resolutions)
+# sim.pass_rates(rule_grid(np.arange(0.5, 0.76, 0.01), abstentions=ABSTENTIONS), by='session_id')
+
+ABSTENTIONS = ('counted', 'ignored', 'members')
+GROUP_BY = ('year', 'session_id')
+
+
+def rule_name(threshold, important_threshold, abstentions):
+    return f"yes >= {threshold:.2f}, important >= {important_threshold:.2f}, abstentions {abstentions}"
+
+
+def rule_grid(thresholds=(0.5,), important_thresholds=None, abstentions=('counted',)):
+    # every combination of the thresholds and abstention handlings - without important
+    # thresholds important resolutions need the same share as the others
+    thresholds = np.round(np.asarray(thresholds, dtype='float64'), 6)
+    if important_thresholds is None:
+        pairs = [(threshold, threshold) for threshold in thresholds]
+    else:
+        important_thresholds = np.round(np.asarray(important_thresholds, dtype='float64'), 6)
+        pairs = [(threshold, important) for threshold in thresholds for important in important_thresholds]
+
+    for mode in abstentions:
+        if mode not in ABSTENTIONS:
+            raise ValueError(f"abstentions must be one of {ABSTENTIONS}, got {mode!r}")
+
+    rules = pd.DataFrame(
+        [(threshold, important, mode) for mode in abstentions for threshold, important in pairs],
+        columns=['threshold', 'important_threshold', 'abstentions'],
+    )
+    rules.insert(0, 'rule', [rule_name(*rule) for rule in rules.itertuples(index=False, name=None)])
+    return rules
+
+
+# the rule behind resolution_passed - PASS_SHARE of the votes cast, abstentions included
+CURRENT_RULE = rule_grid([PASS_SHARE])
+
+
+class VoteSimulator:
+    # shares are rounded to `decimals` like percent_yes, so CURRENT_RULE gives back
+    # resolution_passed - decimals=None compares the exact shares
+
+    def __init__(self, resolutions, decimals=2):
+        yes = resolutions['yes'].to_numpy('float64')
+        no = resolutions['no'].to_numpy('float64')
+        abstain = resolutions['abstain'].to_numpy('float64')
+        n_members = resolutions['n_members'].to_numpy('float64')
+
+        # resolutions x abstention handlings, in the order of ABSTENTIONS - a resolution
+        # without votes (or members) has a share of 0 and passes no rule
+        denominators = np.column_stack([yes + no + abstain, yes + no, n_members])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = np.where(denominators > 0, yes[:, None] / denominators, 0.0)
+        self.shares = shares if decimals is None else round_like_python(shares, decimals)
+        self.important = resolutions['important'].to_numpy() == 1
+
+        # per group, the shares sorted within its other and its important resolutions
+        self.groups = {by: self.sorted_shares(resolutions[by].to_numpy()) for by in GROUP_BY}
+
+    def __len__(self):
+        return len(self.important)
+
+    def sorted_shares(self, keys):
+        # group keys, where each group's other / important / next rows start and the shares of
+        # every abstention handling sorted in those segments - a rule passes the rows from the
+        # first share at or above its threshold to the segment end
+        sorted_shares = []
+        for mode in range(len(ABSTENTIONS)):
+            order = np.lexsort((self.shares[:, mode], self.important, keys))
+            sorted_shares.append(self.shares[order, mode])
+        sorted_keys, important = keys[order], self.important[order]
+
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(keys)]
+        important_starts = ends - np.add.reduceat(important.astype('int64'), starts)
+        return sorted_keys[starts], np.column_stack([starts, important_starts, ends]), sorted_shares
+
+    def outcomes(self, rules):
+        # resolutions x rules, True where the rule passes the resolution
+        modes = rules['abstentions'].map(ABSTENTIONS.index).to_numpy()
+        thresholds = np.where(
+            self.important[:, None],
+            rules['important_threshold'].to_numpy('float64'),
+            rules['threshold'].to_numpy('float64'),
+        )
+        return self.shares[:, modes] >= thresholds
+
+    def pass_rates(self, rules, by='year'):
+        # share of the resolutions of every `by` group each rule passes - one column per rule,
+        # named by the rule, after the group key and its number of resolutions. the same
+        # outcomes as `outcomes`, counted with a binary search per group and segment instead
+        # of building the matrix
+        keys, bounds, sorted_shares = self.groups[by]
+        modes = rules['abstentions'].map(ABSTENTIONS.index).to_numpy()
+        thresholds = rules['threshold'].to_numpy('float64')
+        important_thresholds = rules['important_threshold'].to_numpy('float64')
+
+        passed = np.zeros((len(keys), len(rules)), dtype='int64')
+        for mode in np.unique(modes):
+            columns = np.flatnonzero(modes == mode)
+            shares = sorted_shares[mode]
+            for group, (start, important_start, end) in enumerate(bounds):
+                others = shares[start:important_start]
+                important = shares[important_start:end]
+                passed[group, columns] = (
+                    len(others) - np.searchsorted(others, thresholds[columns])
+                    + len(important) - np.searchsorted(important, important_thresholds[columns])
+                )
+
+        n_resolutions = bounds[:, 2] - bounds[:, 0]
+        rates = pd.DataFrame(passed / n_resolutions[:, None], columns=rules['rule'].tolist())
+        rates.insert(0, by, keys)
+        rates.insert(1, 'n_resolutions', n_resolutions)
+        return rates
+
+
+def range_pass_rates(rates, start_year, end_year):
+    # per year pass rates -> the share of the range's resolutions each rule passes
+    rates = rates[rates['year'].between(start_year, end_year)]
+    n_resolutions = rates['n_resolutions'].sum()
+    if n_resolutions == 0:
+        return pd.Series(np.nan, index=rates.columns[2:])
+    return rates.iloc[:, 2:].mul(rates['n_resolutions'], axis=0).sum() / n_resolutions
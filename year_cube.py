@@ -0,0 +1,49 @@
+import numpy as np
+
+
+# per year aggregate cube with running totals (feature_engine.prefix_sums) - year range
+# queries only touch the cube rows, never the row level data behind them
+class YearCube:
+
+    def __init__(self, cube, year_col, dims):
+        self.year_col = year_col
+        self.dims = list(dims)
+        self.measures = [col[len('cum_'):] for col in cube.columns if col.startswith('cum_')]
+        self.cum_cols = [f'cum_{measure}' for measure in self.measures]
+        self.cube = cube.sort_values(self.dims + [year_col], kind='stable').reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.cube)
+
+    def select(self, where=None):
+        # cube rows with the dimension values in `where`
+        mask = np.ones(len(self.cube), dtype=bool)
+        for col, value in (where or {}).items():
+            mask &= self.cube[col].to_numpy() == value
+        return self.cube[mask]
+
+    def by_year(self, start_year, end_year, by=(), where=None):
+        # measures per year (and `by` dimensions) in the inclusive year range
+        cube = self.select(where)
+        cube = cube[cube[self.year_col].between(start_year, end_year)]
+        return cube.groupby([self.year_col, *by], sort=True)[self.measures].sum().reset_index()
+
+    def totals(self, start_year, end_year, by=(), where=None):
+        # measures summed over the inclusive year range - per cell, the running total
+        # at end_year minus the one before start_year
+        cube = self.select(where)
+        years = cube[self.year_col]
+        upto_end = self.last_totals(cube[years <= end_year])
+        before_start = self.last_totals(cube[years < start_year])
+        totals = upto_end.sub(before_start, fill_value=0).astype(upto_end.dtypes)
+        totals.columns = self.measures
+        # cells with no rows in the range, the first measure is always the row count
+        totals = totals[totals[self.measures[0]] > 0]
+
+        if not by:
+            return totals.sum()
+        return totals.groupby(list(by), sort=True).sum().reset_index()
+
+    def last_totals(self, cube):
+        # latest running totals of every cell
+        return cube.groupby(self.dims, sort=True, dropna=False)[self.cum_cols].last()